@@ -1,36 +1,209 @@
+import os
 import re
 import json
+import time
+import socket
+import httplib
+import urlparse
+import threading
+import Queue
 from time import mktime
-from urllib2 import urlopen
 from email.utils import parsedate
 from sphinxcontrib.imagehelper import (
     ImageConverter, add_image_type, add_image_directive, add_figure_directive
 )
 
+CACOO_URL = 'https://cacoo.com/diagrams/'
+
 
 def cacoo_url_to_diagramid(url):
     return re.sub('https://cacoo\.com/diagrams/', '', url)
 
 
+class CacooError(Exception):
+    pass
+
+
 class Cacoo(object):
-    def __init__(self, apikey):
+    """
+    Client of Cacoo API.
+
+    Diagram informations are kept in *cache* (a dict of diagramid to entry)
+    and are requested at most once per instance. Cached entries are not
+    requested again within *ttl* seconds; after that they are revalidated
+    with conditional requests. Every thread uses its own keep-alive
+    connection.
+    """
+    baseurl = 'https://cacoo.com/api/v1/'
+
+    def __init__(self, apikey, cache=None, ttl=0, timeout=60):
         self.apikey = apikey
+        self.cache = cache if cache is not None else {}
+        self.ttl = ttl
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.pending = {}
+        self.checked = set()
+        self.failed = set()
+
+    def _connection(self):
+        if not hasattr(self.local, 'connection'):
+            url = urlparse.urlsplit(self.baseurl)
+            if url.scheme == 'https':
+                conn = httplib.HTTPSConnection(url.netloc, timeout=self.timeout)
+            else:
+                conn = httplib.HTTPConnection(url.netloc, timeout=self.timeout)
+            self.local.connection = conn
+            with self.lock:
+                self.connections.append(conn)
+
+        return self.local.connection
+
+    def request(self, path, headers={}):
+        path = urlparse.urlsplit(self.baseurl).path + path
+
+        # the server may have dropped an idle connection; retry once
+        for retry in (False, True):
+            conn = self._connection()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                return response, response.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                del self.local.connection
+                if retry:
+                    raise
 
     def get_image_info(self, diagramid):
-        URLBASE = "https://cacoo.com/api/v1/diagrams/%s.json?apiKey=%s"
         diagramid = re.sub('[#-].*', '', diagramid)  # remove sheetid
-        url = URLBASE % (diagramid, self.apikey)
-        return json.loads(urlopen(url).read())
+
+        # look up each diagram only once, even if many threads ask for it
+        with self.lock:
+            if diagramid in self.failed:
+                raise CacooError('Fail to get diagram info: %s' % diagramid)
+
+            entry = self.cache.get(diagramid)
+            if diagramid in self.checked:
+                return entry['info']
+            elif entry and time.time() - entry['checked'] < self.ttl:
+                return entry['info']
+
+            event = self.pending.get(diagramid)
+            if event is None:
+                event = self.pending[diagramid] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            event.wait()
+            return self.get_image_info(diagramid)
+
+        try:
+            info = self._fetch_image_info(diagramid)
+            self.checked.add(diagramid)
+            return info
+        except Exception:
+            self.failed.add(diagramid)
+            raise
+        finally:
+            with self.lock:
+                del self.pending[diagramid]
+            event.set()
+
+    def _fetch_image_info(self, diagramid):
+        entry = self.cache.get(diagramid)
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        path = "diagrams/%s.json?apiKey=%s" % (diagramid, self.apikey)
+        response, body = self.request(path, headers)
+        if response.status == 304 and entry:
+            entry['checked'] = time.time()
+            return entry['info']
+        elif response.status != 200:
+            raise CacooError('Fail to get diagram info: %s (HTTP %d)' %
+                             (diagramid, response.status))
+
+        self.cache[diagramid] = dict(info=json.loads(body),
+                                     etag=response.getheader('etag'),
+                                     last_modified=response.getheader('last-modified'),
+                                     checked=time.time())
+        return self.cache[diagramid]['info']
+
+    def prefetch(self, diagramids, workers):
+        """
+        Look up informations of *diagramids* with at most *workers*
+        concurrent requests. Failures are raised again by get_image_info().
+        """
+        queue = Queue.Queue()
+        for diagramid in set(diagramids):
+            queue.put(diagramid)
+
+        def worker():
+            while True:
+                try:
+                    diagramid = queue.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    self.get_image_info(diagramid)
+                except Exception:
+                    pass
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(workers, queue.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
     def get_last_modified(self, diagramid):
         image_info = self.get_image_info(diagramid)
         return mktime(parsedate(image_info['updated']))
 
     def get_image(self, diagramid):
-        URLBASE = "https://cacoo.com/api/v1/diagrams/%s.png?apiKey=%s"
         diagramid = diagramid.replace('#', '-')
-        url = URLBASE % (diagramid, self.apikey)
-        return urlopen(url)
+        path = "diagrams/%s.png?apiKey=%s" % (diagramid, self.apikey)
+        response, body = self.request(path)
+        if response.status != 200:
+            raise CacooError('Fail to download diagram: %s (HTTP %d)' %
+                             (diagramid, response.status))
+
+        return body
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+
+def get_cache_path(app):
+    return os.path.join(app.doctreedir, 'cacoo.json')
+
+
+def get_cacoo(app):
+    """
+    Get the Cacoo client shared by the whole build.
+    """
+    if not hasattr(app.builder, '_cacoo'):
+        try:
+            with open(get_cache_path(app)) as fd:
+                cache = json.load(fd)
+        except (IOError, ValueError):
+            cache = {}
+
+        app.builder._cacoo = Cacoo(app.config.cacoo_apikey, cache,
+                                   app.config.cacoo_cache_ttl)
+
+    return app.builder._cacoo
 
 
 class CacooConverter(ImageConverter):
@@ -41,7 +214,7 @@ class CacooConverter(ImageConverter):
     def get_last_modified_for(self, node):
         try:
             diagramid = cacoo_url_to_diagramid(node['uri'])
-            return Cacoo(self.apikey).get_last_modified(diagramid)
+            return get_cacoo(self.app).get_last_modified(diagramid)
         except Exception:
             self.warn('Fail to download cacoo image: %s (check your cacoo_apikey or diagramid)' % node['uri'])
             return None
@@ -52,19 +225,91 @@ class CacooConverter(ImageConverter):
 
     def convert(self, node, filename, to):
         try:
-            cacoo = Cacoo(self.apikey)
+            cacoo = get_cacoo(self.app)
             with open(to, 'wb') as fd:
                 diagramid = cacoo_url_to_diagramid(node['uri'])
-                fd.write(cacoo.get_image(diagramid).read())
+                fd.write(cacoo.get_image(diagramid))
                 return True
         except Exception:
             self.warn('Fail to download cacoo image: %s (check your cacoo_apikey or diagramid)' % node['uri'])
             return False
 
 
+def collect_diagrams(app, doctree):
+    env = app.builder.env
+    if not hasattr(env, 'cacoo_diagrams'):
+        env.cacoo_diagrams = {}
+
+    def is_cacoo_image(node):
+        return hasattr(node, 'get') and \
+            node.get('uri', '').startswith(CACOO_URL)
+
+    diagrams = set(cacoo_url_to_diagramid(node['uri'])
+                   for node in doctree.traverse(is_cacoo_image))
+    if diagrams:
+        env.cacoo_diagrams[env.docname] = diagrams
+
+    # documents read in this build are written too
+    if not hasattr(app.builder, '_cacoo_read'):
+        app.builder._cacoo_read = set()
+    app.builder._cacoo_read.add(env.docname)
+
+
+def purge_diagrams(app, env, docname):
+    if hasattr(env, 'cacoo_diagrams'):
+        env.cacoo_diagrams.pop(docname, None)
+
+
+def get_written_docs(app):
+    """
+    Get the documents the builder is going to write, or None for all.
+    """
+    outdated = app.builder.get_outdated_docs()
+    if isinstance(outdated, basestring):
+        return None  # the builder writes all documents
+
+    return set(outdated) | getattr(app.builder, '_cacoo_read', set())
+
+
+def prefetch_diagrams(app, env):
+    """
+    Look up the diagrams of the documents to write at once, before the
+    builder starts writing.
+    """
+    docnames = get_written_docs(app)
+    diagrams = set()
+    for docname, ids in getattr(env, 'cacoo_diagrams', {}).items():
+        if docnames is None or docname in docnames:
+            diagrams.update(ids)
+
+    if diagrams and app.config.cacoo_apikey:
+        get_cacoo(app).prefetch(diagrams, app.config.cacoo_max_connections)
+
+
+def save_cache(app, exception):
+    if hasattr(app.builder, '_cacoo_read'):
+        del app.builder._cacoo_read
+
+    if hasattr(app.builder, '_cacoo'):
+        cacoo = app.builder._cacoo
+        cacoo.close()
+        try:
+            with open(get_cache_path(app), 'w') as fd:
+                json.dump(cacoo.cache, fd)
+        except IOError:
+            app.warn('Fail to save cacoo cache: %s' % get_cache_path(app))
+        del app.builder._cacoo
+
+
 def setup(app):
     add_image_type(app, 'cacoo', 'https://cacoo.com/', CacooConverter)
     add_image_directive(app, 'cacoo')
     add_figure_directive(app, 'cacoo')
 
     app.add_config_value('cacoo_apikey', None, 'html')
+    app.add_config_value('cacoo_cache_ttl', 300, 'html')
+    app.add_config_value('cacoo_max_connections', 4, 'html')
+    app.connect('doctree-read', collect_diagrams)
+    app.connect('env-purge-doc', purge_diagrams)
+    app.connect('env-updated', prefetch_diagrams)
+    app.connect('build-finished', save_cache)
@@ -0,0 +1,203 @@
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+from sphinxcontrib import cacoo
+
+UPDATED = 'Mon, 01 Jun 2015 00:00:00 +0000'
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A stand-in of the Cacoo API, counting the requests per diagram.
+    """
+    daemon_threads = True
+    delay = 0
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def baseurl(self):
+        return 'http://127.0.0.1:%d/api/v1/' % self.server_address[1]
+
+    def count(self, diagramid, status=None):
+        return len([r for r in self.requests
+                    if r[0] == diagramid and status in (None, r[1])])
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        diagramid = self.path.split('/')[-1].split('.')[0]
+        etag = '"%s-1"' % diagramid
+        if diagramid == 'missing':
+            status, body = 404, ''
+        elif self.headers.get('If-None-Match') == etag:
+            status, body = 304, ''
+        else:
+            status = 200
+            body = json.dumps(dict(updated=UPDATED, title=diagramid))
+
+        with self.server.lock:
+            self.server.requests.append((diagramid, status))
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CacooTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def client(self, cache=None, ttl=0):
+        client = cacoo.Cacoo('key', cache, ttl)
+        client.baseurl = self.server.baseurl
+        return client
+
+
+class TestImageInfo(CacooTestCase):
+    def test_requested_once(self):
+        client = self.client()
+        self.assertEqual(client.get_image_info('abc')['title'], 'abc')
+        self.assertEqual(client.get_image_info('abc-1')['title'], 'abc')
+        self.assertEqual(self.server.count('abc'), 1)
+        client.close()
+
+    def test_not_modified(self):
+        client = self.client()
+        info = client.get_image_info('abc')
+        client.close()
+
+        client = self.client(client.cache)
+        self.assertEqual(client.get_image_info('abc'), info)
+        self.assertEqual(self.server.count('abc', 304), 1)
+        client.close()
+
+    def test_ttl(self):
+        client = self.client(ttl=300)
+        client.get_image_info('abc')
+        client.close()
+
+        # the next build trusts the cached entry
+        client = self.client(client.cache, ttl=300)
+        client.get_image_info('abc')
+        self.assertEqual(self.server.count('abc'), 1)
+        client.close()
+
+        # until it expires
+        client.cache['abc']['checked'] -= 301
+        client = self.client(client.cache, ttl=300)
+        client.get_image_info('abc')
+        self.assertEqual(self.server.count('abc'), 2)
+        self.assertEqual(self.server.count('abc', 304), 1)
+        client.close()
+
+    def test_failure(self):
+        client = self.client()
+        self.assertRaises(cacoo.CacooError, client.get_image_info, 'missing')
+        self.assertRaises(cacoo.CacooError, client.get_image_info, 'missing')
+        self.assertEqual(self.server.count('missing'), 1)
+        client.close()
+
+    def test_concurrent(self):
+        self.server.delay = 0.2
+        client = self.client()
+        results = []
+
+        def get():
+            results.append(client.get_image_info('abc'))
+
+        threads = [threading.Thread(target=get) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        self.assertEqual(self.server.count('abc'), 1)
+
+        client.prefetch(['abc', 'def', 'def', 'ghi'], 4)
+        self.assertEqual(self.server.count('def'), 1)
+        self.assertEqual(self.server.count('ghi'), 1)
+        client.close()
+
+
+class Config(object):
+    cacoo_apikey = 'key'
+    cacoo_cache_ttl = 0
+    cacoo_max_connections = 4
+
+
+class Builder(object):
+    def __init__(self, outdated):
+        self.outdated = outdated
+
+    def get_outdated_docs(self):
+        return self.outdated
+
+
+class App(object):
+    def __init__(self, outdated, doctreedir):
+        self.config = Config()
+        self.builder = Builder(outdated)
+        self.doctreedir = doctreedir
+
+
+class Env(object):
+    cacoo_diagrams = {'a': set(['abc']), 'b': set(['def']),
+                      'c': set(['ghi'])}
+
+
+class TestPrefetch(CacooTestCase):
+    def setUp(self):
+        CacooTestCase.setUp(self)
+        self.baseurl = cacoo.Cacoo.baseurl
+        cacoo.Cacoo.baseurl = self.server.baseurl
+        self.doctreedir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        cacoo.Cacoo.baseurl = self.baseurl
+        shutil.rmtree(self.doctreedir)
+        CacooTestCase.tearDown(self)
+
+    def prefetch(self, outdated, read=()):
+        app = App(outdated, self.doctreedir)
+        app.builder._cacoo_read = set(read)
+        cacoo.prefetch_diagrams(app, Env())
+        cacoo.save_cache(app, None)
+
+    def test_written_docs_only(self):
+        self.prefetch(iter(['a']), read=['c'])
+        self.assertEqual(self.server.count('abc'), 1)
+        self.assertEqual(self.server.count('def'), 0)
+        self.assertEqual(self.server.count('ghi'), 1)
+
+    def test_all_docs(self):
+        self.prefetch('all documents')
+        for diagramid in ('abc', 'def', 'ghi'):
+            self.assertEqual(self.server.count(diagramid), 1)
+
+    def test_nothing_written(self):
+        self.prefetch([])
+        self.assertEqual(self.server.requests, [])
@@ -1,102 +1,147 @@
 # -*- coding: utf-8 -*-
 
 import os
-import xml.etree.ElementTree as ET
+try:
+	import xml.etree.cElementTree as ET
+except ImportError:
+	import xml.etree.ElementTree as ET
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
 import urlparse
 import re
-import itertools
+import hashlib
+import tempfile
 
 from docutils import nodes, utils
 from sphinx.util.nodes import split_explicit_title
 from sphinx.util.console import bold, standout
 
-from parsing import normalise, ParseException
+from parsing import normalise, normalise_list, ParseException
 
-def find_url(doc, symbol):
+def _intern(string):
+	#Only byte strings can be interned
+	if isinstance(string, str):
+		return intern(string)
+	return string
+
+class Symbol(object):
 	"""
-	Return the URL for a given symbol.
+	A compact entry of the mapping returned by :py:func:`parse_tag_file`.
 	
-	This is where the magic happens.
-	This function could be a lot more clever. At present it required the passed symbol to be almost exactly the same as the entries in the Doxygen tag file.
+	It can be used like the dictionaries it replaces, i.e. ``symbol['kind']``, ``symbol['file']`` and
+	``symbol.get('arglist')`` work, but it takes a fraction of their memory.
+	"""
+	__slots__ = ('kind', 'file', 'arglist')
+	
+	def __init__(self, kind, file=None, arglist=None):
+		self.kind = kind
+		self.file = file
+		self.arglist = arglist
+	
+	def __getitem__(self, key):
+		value = getattr(self, key, None)
+		if value is None:
+			raise KeyError(key)
+		return value
+	
+	def get(self, key, default=None):
+		value = getattr(self, key, None)
+		if value is None:
+			return default
+		return value
+	
+	def __getstate__(self):
+		return (self.kind, self.file, self.arglist)
+	
+	def __setstate__(self, state):
+		self.kind, self.file, self.arglist = state
+	
+	def __eq__(self, other):
+		if isinstance(other, Symbol):
+			other = other.__getstate__()
+		elif isinstance(other, dict):
+			other = (other.get('kind'), other.get('file'), other.get('arglist'))
+		return self.__getstate__() == other
+	
+	def __ne__(self, other):
+		return not self == other
+	
+	def __repr__(self):
+		return 'Symbol(%r, %r, %r)' % self.__getstate__()
+
+def iter_tag_file(source):
+	"""
+	Read a Doxygen tag file incrementally.
 	
-	.. todo::
-		
-		Maybe print a list of all possible matches as a warning (but still only return the first)
+	Yields ``('compound', kind, name, filename)`` for every top-level compound and, after it,
+	``('member', kind, name, anchorfile, anchor, arglist)`` for each of its members. Elements are
+	dropped as soon as they have been read so the whole tree is never kept in memory.
 	
 	:Parameters:
-		doc : xml.etree.ElementTree
-			The XML DOM object
-		symbol : string
-			The symbol to lookup in the file. E.g. something like 'PolyVox::Array' or 'tidyUpMemory'
-	
-	:return: String representing the filename part of the URL
+		source : string or file object
+			The tag file
 	"""
-	
-	#First check for an exact match with a top-level object (namespaces, objects etc.)
-	
-	#env = inliner.document.settings.env
-	
-	matches = []
-	for compound in doc.findall('.//compound'):
-		if compound.find('name').text == symbol:
-			matches += [{'file':compound.find('filename').text, 'kind':compound.get('kind')}]
-	
-	if len(matches) > 1:
-		pass
-		#env.warn(env.docname, 'There were multiple matches for `%s`: %s' % (symbol, matches))
-	if len(matches) == 1:
-		return matches[0]
-	
-	
-	#Strip off first namespace bit of the compound name so that 'ArraySizes' can match 'PolyVox::ArraySizes'
-	for compound in doc.findall('.//compound'):
-		symbol_list = compound.find('name').text.split('::', 1)
-		if len(symbol_list) == 2:
-			reducedsymbol = symbol_list[1]
-			if reducedsymbol == symbol:
-				return {'file':compound.find('filename').text, 'kind':compound.get('kind')}
-	
-	#Now split the symbol by '::'. Find an exact match for the first part and then a member match for the second
-	#So PolyVox::Array::operator[] becomes like {namespace: "PolyVox::Array", endsymbol: "operator[]"}
-	symbol_list = symbol.rsplit('::', 1)
-	if len(symbol_list) == 2:
-		namespace = symbol_list[0]
-		endsymbol = symbol_list[1]
-		for compound in doc.findall('.//compound'):
-			if compound.find('name').text == namespace:
-				for member in compound.findall('member'):
-					#If this compound object contains the matching member then return it
-					if member.find('name').text == endsymbol:
-						return {'file':(member.findtext('anchorfile') or compound.findtext('filename')) + '#' + member.find('anchor').text, 'kind':member.get('kind')}
-	
-	#Then we'll look at unqualified members
-	for member in doc.findall('.//member'):
-		if member.find('name').text == symbol:
-			return {'file':(member.findtext('anchorfile') or compound.findtext('filename')) + '#' + member.find('anchor').text, 'kind':member.get('kind')}
-	
-	return None
+	root = compound = None
+	depth = 0
+	for event, elem in ET.iterparse(source, events=('start', 'end')):
+		if event == 'start':
+			if depth == 0:
+				root = elem
+			elif depth == 1 and elem.tag == 'compound':
+				compound = elem
+				name = filename = None
+				announced = False
+			depth += 1
+			continue
+		
+		depth -= 1
+		if depth == 2 and compound is not None:
+			#A direct child of a compound; drop it from the tree once read
+			if elem.tag == 'name':
+				name = elem.text
+			elif elem.tag == 'filename':
+				filename = elem.text
+			elif elem.tag == 'member':
+				if not announced:
+					yield ('compound', compound.get('kind'), name, filename)
+					announced = True
+				yield ('member', elem.get('kind'), elem.findtext('name'), elem.findtext('anchorfile'),
+				       elem.findtext('anchor'), elem.findtext('arglist'))
+			compound.remove(elem)
+		elif depth == 1:
+			if elem is compound:
+				if not announced:
+					yield ('compound', compound.get('kind'), name, filename)
+				compound = None
+			root.remove(elem)
 
-def parse_tag_file(doc):
+def iter_tag_tree(doc):
 	"""
-	Takes in an XML tree from a Doxygen tag file and returns a dictionary that looks something like:
+	The same as :py:func:`iter_tag_file` for a tag file which has already been parsed into an ElementTree.
+	"""
+	for compound in doc.findall('./compound'):
+		yield ('compound', compound.get('kind'), compound.findtext('name'), compound.findtext('filename'))
+		for member in compound.findall('member'):
+			yield ('member', member.get('kind'), member.findtext('name'), member.findtext('anchorfile'),
+			       member.findtext('anchor'), member.findtext('./arglist'))
+
+def parse_tag_file(doc, processes=0):
+	"""
+	Takes in a Doxygen tag file and returns a dictionary of :py:class:`Symbol` entries that looks something like:
 	
 	.. code-block:: python
 	
-		{'PolyVox': {'file': 'namespace_poly_vox.html',
-		             'kind': 'namespace'},
-		 'PolyVox::Array': {'file': 'class_poly_vox_1_1_array.html',
-		                    'kind': 'class'},
-		 'PolyVox::Array1DDouble': {'file': 'namespace_poly_vox.html#a7a1f5fd5c4f7fbb4258a495d707b5c13',
-		                            'kind': 'typedef'},
-		 'PolyVox::Array1DFloat': {'file': 'namespace_poly_vox.html#a879a120e49733eba1905c33f8a7f131b',
-		                           'kind': 'typedef'},
-		 'PolyVox::Array1DInt16': {'file': 'namespace_poly_vox.html#aa1463ece448c6ebed55ab429d6ae3e43',
-		                           'kind': 'typedef'},
-		 'QScriptContext::throwError': {'arglist': {'( Error error, const QString & text )': 'qscriptcontext.html#throwError',
-		                                            '( const QString & text )': 'qscriptcontext.html#throwError-2'},
-		                                'kind': 'function'},
-		 'QScriptContext::toString': {'arglist': {'()': 'qscriptcontext.html#toString'},
-		                              'kind': 'function'}}
+		{'PolyVox': Symbol(kind='namespace', file='namespace_poly_vox.html'),
+		 'PolyVox::Array': Symbol(kind='class', file='class_poly_vox_1_1_array.html'),
+		 'PolyVox::Array1DDouble': Symbol(kind='typedef', file='namespace_poly_vox.html#a7a1f5fd5c4f7fbb4258a495d707b5c13'),
+		 'PolyVox::Array1DFloat': Symbol(kind='typedef', file='namespace_poly_vox.html#a879a120e49733eba1905c33f8a7f131b'),
+		 'PolyVox::Array1DInt16': Symbol(kind='typedef', file='namespace_poly_vox.html#aa1463ece448c6ebed55ab429d6ae3e43'),
+		 'QScriptContext::throwError': Symbol(kind='function',
+		                                      arglist={'( Error error, const QString & text )': 'qscriptcontext.html#throwError',
+		                                               '( const QString & text )': 'qscriptcontext.html#throwError-2'}),
+		 'QScriptContext::toString': Symbol(kind='function', arglist={'()': 'qscriptcontext.html#toString'})}
 	
 	Note the different form for functions. This is required to allow for 'overloading by argument type'.
 	
@@ -111,63 +156,233 @@ def parse_tag_file(doc):
 			url = symbol_mapping['file']
 	
 	:Parameters:
-		doc : xml.etree.ElementTree
-			The XML DOM object
+		doc : string, file object or xml.etree.ElementTree
+			The tag file, which is read incrementally, or an already parsed XML DOM object
+		processes : int
+			If more than 1, the argument lists of the functions are normalised by that many worker processes
 	
 	:return: a dictionary mapping fully qualified symbols to files
 	"""
 	
+	if hasattr(doc, 'findall'):
+		items = iter_tag_tree(doc)
+	else:
+		items = iter_tag_file(doc)
+	
 	mapping = {}
 	function_list = [] #This is a list of function to be parsed and inserted into mapping at the end of the function.
-	for compound in doc.findall("./compound"):
-		compound_kind = compound.get('kind')
-		if compound_kind != 'namespace' and compound_kind != 'class' and compound_kind!= 'struct' and compound_kind != 'file':
-			continue #Skip everything that isn't a namespace, class, struct or file
+	compound_name = None
+	for item in items:
+		if item[0] == 'compound':
+			compound_kind, compound_name, compound_filename = item[1:]
+			if compound_kind != 'namespace' and compound_kind != 'class' and compound_kind!= 'struct' and compound_kind != 'file':
+				compound_name = None
+				continue #Skip everything that isn't a namespace, class, struct or file
+			
+			#TODO The following is a hack bug fix I think
+			#Doxygen doesn't seem to include the file extension to <compound kind="file"><filename> entries
+			#If it's a 'file' type, check if it _does_ have an extension, if not append '.html'
+			if compound_kind == 'file' and not os.path.splitext(compound_filename)[1]:
+				compound_filename = join(compound_filename, '.html')
+			
+			#If it's a compound we can simply add it
+			mapping[compound_name] = Symbol(_intern(compound_kind), compound_filename)
+			continue
 		
-		compound_name = compound.findtext('name')
-		compound_filename = compound.findtext('filename')
+		if compound_name is None:
+			continue #A member of a skipped compound
 		
-		#TODO The following is a hack bug fix I think
-		#Doxygen doesn't seem to include the file extension to <compound kind="file"><filename> entries
-		#If it's a 'file' type, check if it _does_ have an extension, if not append '.html'
-		if compound_kind == 'file' and not os.path.splitext(compound_filename)[1]:
-			compound_filename = join(compound_filename, '.html')
+		member_kind, member_name, anchorfile, anchor, arglist_text = item[1:]
 		
-		#If it's a compound we can simply add it
-		mapping[compound_name] = {'kind' : compound_kind, 'file' : compound_filename}
+		#If the member doesn't have an <anchorfile> element, use the parent compounds <filename> instead
+		#This is the way it is in the qt.tag and is perhaps an artefact of old Doxygen
+		anchorfile = anchorfile or compound_filename
+		member_symbol = join(compound_name, '::', member_name)
+		member_kind = _intern(member_kind)
+		#If it has an <arglist> then we assume it's a function. Empty <arglist> returns '', not None. Things like typedefs and enums can have empty arglists
 		
-		for member in compound.findall('member'):
-			
-			#If the member doesn't have an <anchorfile> element, use the parent compounds <filename> instead
-			#This is the way it is in the qt.tag and is perhaps an artefact of old Doxygen
-			anchorfile = member.findtext('anchorfile') or compound_filename
-			member_symbol = join(compound_name, '::', member.findtext('name'))
-			member_kind = member.get('kind')
-			arglist_text = member.findtext('./arglist') #If it has an <arglist> then we assume it's a function. Empty <arglist> returns '', not None. Things like typedefs and enums can have empty arglists
-			
-			if arglist_text and member_kind != 'variable' and member_kind != 'typedef' and member_kind != 'enumeration':
-				function_list.append((member_symbol, arglist_text, member_kind, join(anchorfile,'#',member.findtext('anchor'))))
-			else:
-				mapping[member_symbol] = {'kind' : member.get('kind'), 'file' : join(anchorfile,'#',member.findtext('anchor'))}
+		if arglist_text and member_kind != 'variable' and member_kind != 'typedef' and member_kind != 'enumeration':
+			function_list.append((member_symbol, arglist_text, member_kind, join(anchorfile,'#',anchor)))
+		else:
+			mapping[member_symbol] = Symbol(member_kind, join(anchorfile,'#',anchor))
 	
-	for old_tuple, normalised_tuple in zip(function_list, itertools.imap(normalise, (member_tuple[1] for member_tuple in function_list))):
+	for old_tuple, normalised_tuple in zip(function_list, normalise_list([member_tuple[1] for member_tuple in function_list], processes)):
 		member_symbol = old_tuple[0]
 		original_arglist = old_tuple[1]
 		kind = old_tuple[2]
 		anchor_link = old_tuple[3]
 		normalised_arglist = normalised_tuple[1]
 		if normalised_tuple[1] is not None: #This is a 'flag' for a ParseException having happened
+			#Normalised argument lists repeat a lot ('()', '(int)', ...) so share them
+			normalised_arglist = _intern(normalised_arglist)
 			if mapping.get(member_symbol) and mapping[member_symbol]['kind'] == 'function':
 				mapping[member_symbol]['arglist'][normalised_arglist] = anchor_link
 			else:
-				mapping[member_symbol] = {'kind' : kind, 'arglist' : {normalised_arglist : anchor_link}}
+				mapping[member_symbol] = Symbol(kind, arglist={normalised_arglist : anchor_link})
 		else:
 			print('Skipping %s %s%s. Error reported from parser was: %s' % (old_tuple[2], old_tuple[0], old_tuple[1], normalised_tuple[0]))
 	
 	#from pprint import pprint; pprint(mapping)
 	return mapping
 
-def find_url2(mapping, symbol):
+#Part of the names of the files in the shared cache. Change it whenever the mapping or Symbol changes
+TAG_CACHE_VERSION = 1
+
+def hash_tag_file(tag_filename):
+	"""Returns the SHA-1 of the content of *tag_filename* as a hex string"""
+	digest = hashlib.sha1()
+	with open(tag_filename, 'rb') as stream:
+		for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+def load_tag_file(tag_filename, cache_dir=None, processes=0):
+	"""
+	Returns the mapping of :py:func:`parse_tag_file` for *tag_filename*.
+	
+	If *cache_dir* is given, parsed tag files are pickled into it under the SHA-1 of their content, so every project
+	linking to the same tag file parses it only once.
+	
+	:Parameters:
+		tag_filename : string
+			The tag file
+		cache_dir : string
+			The directory of the shared cache. It is created if needed
+		processes : int
+			Passed on to :py:func:`parse_tag_file`
+	"""
+	if not cache_dir:
+		return parse_tag_file(tag_filename, processes)
+	
+	cache_filename = os.path.join(cache_dir, '%s-%d.pickle' % (hash_tag_file(tag_filename), TAG_CACHE_VERSION))
+	try:
+		with open(cache_filename, 'rb') as stream:
+			return pickle.load(stream)
+	except Exception:
+		pass #Not cached yet, or unreadable
+	
+	mapping = parse_tag_file(tag_filename, processes)
+	
+	#Write to a temporary file first so that other builds never see half a pickle
+	try:
+		if not os.path.isdir(cache_dir):
+			os.makedirs(cache_dir)
+		fd, temp_filename = tempfile.mkstemp(dir=cache_dir)
+	except (IOError, OSError):
+		return mapping #The cache directory is not writable
+	
+	try:
+		with os.fdopen(fd, 'wb') as stream:
+			pickle.dump(mapping, stream, pickle.HIGHEST_PROTOCOL)
+		os.chmod(temp_filename, 0o644) #mkstemp only lets the owner read it
+		os.rename(temp_filename, cache_filename)
+	except (IOError, OSError):
+		#On Windows if another build has just stored the same file
+		os.remove(temp_filename)
+	
+	return mapping
+
+class SymbolIndex(object):
+	"""
+	An index over the symbols of a mapping which answers the same question as :py:func:`find_url_piecewise`,
+	:py:func:`find_url_classes` and :py:func:`find_url_remove_templates` together without scanning the whole mapping.
+	
+	The symbols are stored in a trie keyed on their reversed ``::`` segments, so ``PolyVox::Volume::FloatVolume`` is found
+	under ``FloatVolume``, ``Volume``, ``PolyVox``. Every trie node keeps a summary of the symbols ending exactly there and
+	of all the symbols below it: how many there are, how many are classes and the first symbol, first class, first
+	non-templated class and first non-templated symbol. A lookup walks the reversed segments of the requested symbol and
+	combines these summaries, so it costs time proportional to the depth of the symbol rather than the size of the mapping.
+	
+	Symbols are numbered in sorted order and "first" means the lowest number.
+	"""
+	
+	# Indices into a summary
+	COUNT, FIRST, CLASSES, FIRST_CLASS, FIRST_PLAIN_CLASS, FIRST_PLAIN = range(6)
+	
+	def __init__(self, mapping):
+		self.root = self._node()
+		for number, symbol in enumerate(sorted(mapping)):
+			self.add(number, symbol, mapping[symbol]['kind'])
+	
+	@staticmethod
+	def _node():
+		# [children, summary of the symbols ending here, summary of all the symbols below]
+		return [{}, [0, None, 0, None, None, None], [0, None, 0, None, None, None]]
+	
+	@classmethod
+	def _add_to_summary(cls, summary, item, is_class, is_plain):
+		summary[cls.COUNT] += 1
+		if summary[cls.FIRST] is None:
+			summary[cls.FIRST] = item
+		if is_class:
+			summary[cls.CLASSES] += 1
+			if summary[cls.FIRST_CLASS] is None:
+				summary[cls.FIRST_CLASS] = item
+			if is_plain and summary[cls.FIRST_PLAIN_CLASS] is None:
+				summary[cls.FIRST_PLAIN_CLASS] = item
+		if is_plain and summary[cls.FIRST_PLAIN] is None:
+			summary[cls.FIRST_PLAIN] = item
+	
+	@classmethod
+	def _merge_summary(cls, summary, other):
+		summary[cls.COUNT] += other[cls.COUNT]
+		summary[cls.CLASSES] += other[cls.CLASSES]
+		for field in (cls.FIRST, cls.FIRST_CLASS, cls.FIRST_PLAIN_CLASS, cls.FIRST_PLAIN):
+			if summary[field] is None or (other[field] is not None and other[field] < summary[field]):
+				summary[field] = other[field]
+	
+	def add(self, number, symbol, kind):
+		item = (number, symbol)
+		is_class = kind == 'class'
+		is_plain = '<' not in symbol
+		
+		parts = symbol.split('::')
+		parts.reverse()
+		node = self.root
+		for part in parts:
+			child = node[0].get(part)
+			if child is None:
+				child = node[0][part] = self._node()
+			node = child
+			self._add_to_summary(node[2], item, is_class, is_plain)
+		self._add_to_summary(node[1], item, is_class, is_plain)
+	
+	def find(self, symbol):
+		"""
+		Return the name of the symbol in the mapping which matches `symbol`, or None.
+		"""
+		parts = symbol.split('::')
+		parts.reverse()
+		
+		summary = [0, None, 0, None, None, None]
+		node = self.root
+		for depth, part in enumerate(parts):
+			node = node[0].get(part)
+			if node is None:
+				break
+			if depth == len(parts) - 1:
+				#The symbol is a suffix of everything below here
+				self._merge_summary(summary, node[2])
+			else:
+				#Everything ending here is a suffix of the symbol
+				self._merge_summary(summary, node[1])
+		
+		#The same precedence as in find_url2: a single match, a single class,
+		#then the first non-templated class or symbol
+		if summary[self.COUNT] == 1:
+			item = summary[self.FIRST]
+		elif summary[self.CLASSES] == 1:
+			item = summary[self.FIRST_CLASS]
+		elif summary[self.CLASSES] > 1:
+			item = summary[self.FIRST_PLAIN_CLASS]
+		else:
+			item = summary[self.FIRST_PLAIN]
+		
+		if item is None:
+			return None
+		return item[1]
+
+def find_url2(mapping, symbol, index=None):
 	"""
 	Return the URL for a given symbol.
 	
@@ -182,6 +397,8 @@ def find_url2(mapping, symbol):
 			A dictionary of the form returned by :py:func:`parse_tag_file`
 		symbol : string
 			The symbol to lookup in the file. E.g. something like 'PolyVox::Array' or 'tidyUpMemory'
+		index : :py:class:`SymbolIndex`
+			An index of `mapping`. If given, it is used instead of scanning the whole mapping
 	
 	:return: String representing the filename part of the URL
 	
@@ -217,6 +434,12 @@ def find_url2(mapping, symbol):
 	
 	#print("Still", len(endswith_list), 'possible matches')
 	
+	if index is not None:
+		match = index.find(symbol)
+		if match is None:
+			return None
+		return return_from_mapping(mapping[match], normalised_arglist)
+	
 	piecewise_list = find_url_piecewise(mapping, symbol)
 	
 	#If there is only one match, return it.
@@ -378,44 +601,66 @@ def create_role(app, tag_filename, rootdir):
 	if not rootdir.endswith(('/', '\\')):
 		rootdir = join(rootdir, os.sep)
 	
+	cache_name = os.path.basename(tag_filename)
+	
 	try:
-		tag_file = ET.parse(tag_filename)
-		
-		cache_name = os.path.basename(tag_filename)
+		mtime = os.path.getmtime(tag_filename)
 		
 		app.info(bold('Checking tag file cache for %s: ' % cache_name), nonl=True)
 		if not hasattr(app.env, 'doxylink_cache'):
 			# no cache present at all, initialise it
 			app.info('No cache at all, rebuilding...')
-			mapping = parse_tag_file(tag_file)
-			app.env.doxylink_cache = { cache_name : {'mapping' : mapping, 'mtime' : os.path.getmtime(tag_filename)}}
+			app.env.doxylink_cache = {}
+			stale = True
 		elif not app.env.doxylink_cache.get(cache_name):
 			# Main cache is there but the specific sub-cache for this tag file is not
 			app.info('Sub cache is missing, rebuilding...')
-			mapping = parse_tag_file(tag_file)
-			app.env.doxylink_cache[cache_name] = {'mapping' : mapping, 'mtime' : os.path.getmtime(tag_filename)}
-		elif app.env.doxylink_cache[cache_name]['mtime'] < os.path.getmtime(tag_filename):
+			stale = True
+		elif app.env.doxylink_cache[cache_name]['mtime'] < mtime:
 			# tag file has been modified since sub-cache creation
 			app.info('Sub-cache is out of date, rebuilding...')
-			mapping = parse_tag_file(tag_file)
-			app.env.doxylink_cache[cache_name] = {'mapping' : mapping, 'mtime' : os.path.getmtime(tag_filename)}
+			stale = True
 		else:
 			#The cache is up to date
 			app.info('Sub-cache is up-to-date')
-	except IOError:
-		tag_file = None
+			stale = False
+		
+		if stale:
+			#Parsed, or loaded from the shared cache, the first time a role needs it
+			app.env.doxylink_cache.pop(cache_name, None)
+		
+		tag_file_found = True
+	except (IOError, OSError):
+		tag_file_found = False
 		app.warn(standout('Could not open tag file %s. Make sure your `doxylink` config variable is set correctly.' % tag_filename))
 	
+	index = []
+	
+	def get_mapping():
+		if not app.env.doxylink_cache.get(cache_name):
+			cache_dir = app.config.doxylink_cache_dir
+			if cache_dir:
+				cache_dir = os.path.join(app.confdir, os.path.expanduser(cache_dir))
+			mapping = load_tag_file(tag_filename, cache_dir, app.config.doxylink_parse_processes)
+			app.env.doxylink_cache[cache_name] = {'mapping' : mapping, 'mtime' : mtime}
+		return app.env.doxylink_cache[cache_name]['mapping']
+	
+	def get_index():
+		#Build the index on first use; it is not stored in the environment
+		if not index:
+			index.append(SymbolIndex(get_mapping()))
+		return index[0]
+	
 	def find_doxygen_link(name, rawtext, text, lineno, inliner, options={}, content=[]):
 		text = utils.unescape(text)
 		# from :name:`title <part>`
 		has_explicit_title, title, part = split_explicit_title(text)
 		warning_messages = []
-		if tag_file:
-			url = find_url(tag_file, part)
+		if tag_file_found:
 			try:
-				url = find_url2(app.env.doxylink_cache[cache_name]['mapping'], part)
+				url = find_url2(get_mapping(), part, get_index())
 			except LookupError as error:
+				url = None
 				warning_messages.append('Error while parsing `%s`. Is not a well-formed C++ function call or symbol. If this is not the case, it is a doxylink bug so please report it. Error reported was: %s' % (part, error))
 			if url:
 				
@@ -449,4 +694,6 @@ def setup_doxylink_roles(app):
 
 def setup(app):
 	app.add_config_value('doxylink', {}, 'env')
+	app.add_config_value('doxylink_parse_processes', 0, '')
+	app.add_config_value('doxylink_cache_dir', None, '')
 	app.connect('builder-inited', setup_doxylink_roles)
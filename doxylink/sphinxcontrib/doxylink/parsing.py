@@ -1,5 +1,5 @@
-#import multiprocessing
-import itertools
+import re
+import multiprocessing
 
 from pyparsing import Word, Literal, alphas, nums, alphanums, OneOrMore, Optional, SkipTo, ParseException, Group, ZeroOrMore, Suppress, Combine, delimitedList, quotedString, nestedExpr, ParseResults, oneOf
 
@@ -59,10 +59,189 @@ argument = Group(argument_type('argument_type') + Optional(input_name) + Optiona
 #List of arguments in parentheses with an optional 'const' on the end
 arglist = LPAR + delimitedList(argument)('arg_list') + Optional(COMMA + '...')('var_args') + RPAR
 
+class UnsupportedArglist(Exception):
+	"""
+	Raised by :py:func:`tokenise_arglist` for an argument list it does not handle exactly like the pyparsing grammar.
+	"""
+	pass
+
+WHITESPACE = re.compile(r'[ \n\t\r]*')
+QUALIFIER = re.compile(r'const|unsigned|typename|struct|enum')
+TYPE_WORD = re.compile(r'[A-Za-z0-9_:]+')
+NAME_WORD = re.compile(r'[A-Za-z0-9_]+')
+TEMPLATE_WORD = re.compile(r'[^<> \n\t\r]+')
+#number and Word('|&^') of default_value
+DEFAULT_WORD = re.compile(r'[-.0-9]+|[|&^]+')
+WORD_CHARS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_:')
+
+def tokenise_template(s, pos):
+	"""
+	Reads the angle bracket pair starting at ``s[pos]`` the way :py:data:`angle_bracket_pair` does.
+	
+	:return: a tuple of the normalised template, e.g. ``'< ControllerValue < T > >'``, and the position after it
+	"""
+	s_list = ['<']
+	pos += 1
+	while True:
+		pos = WHITESPACE.match(s, pos).end()
+		if pos == len(s):
+			raise UnsupportedArglist('unbalanced angle brackets')
+		elif s[pos] == '>':
+			s_list.append(' >')
+			return ''.join(s_list), pos + 1
+		elif s[pos] == '<':
+			template, pos = tokenise_template(s, pos)
+		else:
+			match = TEMPLATE_WORD.match(s, pos)
+			template, pos = match.group(), match.end()
+		s_list.append(' ' + template)
+
+def skip_to(s, pos, closer):
+	"""Skips the bracket pair starting at ``s[pos]`` the way :py:data:`parentheses_pair` does, i.e. up to the first *closer*"""
+	end = s.find(closer, pos + 1) + 1
+	if end == 0 or end == len(s):
+		#Unbalanced, or swallowing the closing bracket of the argument list
+		raise UnsupportedArglist('unbalanced %s' % closer)
+	return end
+
+def tokenise_argument(s, pos):
+	"""
+	Reads a single argument of an argument list like :py:data:`argument` does.
+	
+	:return: a tuple of the normalised argument, e.g. ``'const QString&'``, and the position after it
+	"""
+	#The qualifier (only one, pyparsing does not return several in a consistent way)
+	pos = WHITESPACE.match(s, pos).end()
+	qualifier = QUALIFIER.match(s, pos)
+	if qualifier:
+		pos = qualifier.end()
+		if s[pos] in WORD_CHARS:
+			raise UnsupportedArglist('qualifier followed by a word character')
+		qualifier = qualifier.group()
+		pos = WHITESPACE.match(s, pos).end()
+		if QUALIFIER.match(s, pos):
+			raise UnsupportedArglist('multiple qualifiers')
+	
+	#The type, with an adjacent template and a word after it
+	match = TYPE_WORD.match(s, pos)
+	if not match:
+		raise UnsupportedArglist('missing type')
+	input_type, pos = match.group(), match.end()
+	if s[pos] == '<':
+		template, pos = tokenise_template(s, pos)
+		input_type += template
+		match = TYPE_WORD.match(s, pos)
+		if match:
+			input_type, pos = input_type + match.group(), match.end()
+		if s[pos] == '<':
+			raise UnsupportedArglist('template after the type')
+	
+	#The '*', '&' and 'const' bits
+	pos = WHITESPACE.match(s, pos).end()
+	pointer_or_reference1 = pointer_or_reference2 = ''
+	if s[pos] in '*&':
+		pointer_or_reference1 = s[pos]
+		pos = WHITESPACE.match(s, pos + 1).end()
+	const = s.startswith('const', pos)
+	if const:
+		if s[pos + 5] in WORD_CHARS:
+			raise UnsupportedArglist('const followed by a word character')
+		pos = WHITESPACE.match(s, pos + 5).end()
+	if s[pos] in '*&':
+		pointer_or_reference2 = s[pos]
+		pos += 1
+	
+	#The name, which is ignored
+	while True:
+		pos = WHITESPACE.match(s, pos).end()
+		match = NAME_WORD.match(s, pos)
+		if match:
+			pos = match.end()
+		elif s[pos] == '<':
+			pos = tokenise_template(s, pos)[1]
+		elif s[pos] == '(':
+			pos = skip_to(s, pos, ')')
+		elif s[pos] == '[':
+			pos = skip_to(s, pos, ']')
+		else:
+			break
+	
+	#The default value, which is ignored as well
+	if s[pos] == '=':
+		start = pos = pos + 1
+		while True:
+			pos = WHITESPACE.match(s, pos).end()
+			match = DEFAULT_WORD.match(s, pos) or TYPE_WORD.match(s, pos)
+			if match:
+				pos = match.end()
+				if s[pos] == '<':
+					pos = tokenise_template(s, pos)[1]
+					match = TYPE_WORD.match(s, pos)
+					if match:
+						pos = match.end()
+			elif s[pos] == '(':
+				pos = skip_to(s, pos, ')')
+			elif s[pos] == '<':
+				pos = tokenise_template(s, pos)[1]
+			elif s[pos] == '[':
+				pos = skip_to(s, pos, ']')
+			else:
+				break
+		if WHITESPACE.match(s, start).end() == pos:
+			raise UnsupportedArglist('empty default value')
+	
+	argument_string_list = [qualifier + ' ' if qualifier else '', input_type, pointer_or_reference1]
+	if const:
+		argument_string_list.append(' const ')
+	argument_string_list.append(pointer_or_reference2)
+	return ''.join(argument_string_list), pos
+
+def tokenise_arglist(s):
+	"""
+	A hand-written equivalent of :py:data:`arglist` which is much faster than the pyparsing grammar.
+	
+	It only handles the argument lists it can normalise exactly as the grammar does and raises
+	:py:class:`UnsupportedArglist` for everything else (quoted strings, several qualifiers, odd spacing, syntax errors, ...),
+	which are then left to pyparsing.
+	
+	:Parameters:
+		s : string
+			An argument list without suffix like ``'( const QString & text, int index = -1 )'``
+	
+	:return: a tuple of the list of normalised arguments and whether the function has a variable number of arguments
+	"""
+	if '"' in s or "'" in s:
+		raise UnsupportedArglist('quoted string')
+	
+	normalised_arg_list = []
+	var_args = False
+	pos = 1
+	while True:
+		argument, pos = tokenise_argument(s, pos)
+		normalised_arg_list.append(argument)
+		pos = WHITESPACE.match(s, pos).end()
+		if s[pos] != ',':
+			break
+		pos = WHITESPACE.match(s, pos + 1).end()
+		if s.startswith('...', pos):
+			var_args = True
+			pos = WHITESPACE.match(s, pos + 3).end()
+			break
+	
+	if pos != len(s) - 1:
+		raise UnsupportedArglist('unexpected %r at %d' % (s[pos:pos + 1], pos))
+	return normalised_arg_list, var_args
+
+#Normalised argument lists by their raw form; the same ones ('(int index)', '(const QString &text)', ...) come up again and again
+arglist_cache = {}
+ARGLIST_CACHE_SIZE = 100000
+
 def normalise(symbol):
 	"""
 	Takes a c++ symbol or funtion and splits it into symbol and a normalised argument list.
 	
+	The normalised form of every argument list is remembered, so the same one is only parsed once.
+	
 	:Parameters:
 		symbol : string
 			A C++ symbol or function definition like ``PolyVox::Volume``, ``Volume::printAll() const``
@@ -80,12 +259,38 @@ def normalise(symbol):
 		#If there's no brackets, then there's no function signature. This means the passed in symbol is just a type name
 		return symbol, ''
 	
+	try:
+		error, normalised_arg_list_string = arglist_cache[arglist_input_string]
+	except KeyError:
+		error, normalised_arg_list_string = normalise_arglist(arglist_input_string)
+		if len(arglist_cache) >= ARGLIST_CACHE_SIZE:
+			arglist_cache.clear()
+		arglist_cache[arglist_input_string] = error, normalised_arg_list_string
+	
+	if normalised_arg_list_string is None:
+		return error, None
+	return function_name, normalised_arg_list_string
+
+def normalise_arglist(arglist_input_string, tokenise=True):
+	"""
+	Normalises an argument list like ``'( const QString & text, int index = -1 ) const'`` to ``'(const QString&, int) const'``.
+	
+	:Parameters:
+		arglist_input_string : string
+			The argument list, starting with its opening bracket
+		tokenise : bool
+			Whether to try :py:func:`tokenise_arglist` before the pyparsing grammar
+	
+	:return:
+		a tuple ``(None, normalised argument list)`` or ``(error message, None)`` if the argument list could not be parsed
+	"""
+	
 	#This is a very common signature so we'll make a special case for it. It requires no parsing anyway
 	if arglist_input_string.startswith('()'):
 		if arglist_input_string in ('()', '()=0'):
-			return function_name, arglist_input_string
+			return None, arglist_input_string
 		elif arglist_input_string in ('() const ', '() const', '() const =0'):
-			return function_name, '() const'
+			return None, '() const'
 	
 	#By now we're left with something like "(blah, blah)", "(blah, blah) const" or "(blah, blah) const =0"
 	try:
@@ -98,12 +303,17 @@ def normalise(symbol):
 		raise
 	
 	try:
-		result = arglist.parseString(arglist_input_string)
-	except ParseException as error:
-		#print symbol
-		#print pe
-		return str(error), None
-	else:
+		if not tokenise:
+			raise UnsupportedArglist('tokeniser disabled')
+		normalised_arg_list, var_args = tokenise_arglist(arglist_input_string)
+	except UnsupportedArglist:
+		try:
+			result = arglist.parseString(arglist_input_string)
+		except ParseException as error:
+			#print symbol
+			#print pe
+			return str(error), None
+		
 		#Will be a list or normalised string arguments
 		#e.g. ['OBMol&', 'vector< int >&', 'OBBitVec&', 'OBBitVec&', 'int', 'int']
 		normalised_arg_list = []
@@ -129,25 +339,45 @@ def normalise(symbol):
 			#Finally we join our argument string and add it to our list
 			normalised_arg_list.append(''.join(argument_string_list))
 		
-		#If the function contains a variable number of arguments (int foo, ...) then add them on.
-		if result.var_args:
-			normalised_arg_list.append('...')
-		
-		#Combine all the arguments and put parentheses around it
-		normalised_arg_list_string = ''.join(['(', ', '.join(normalised_arg_list), ')'])
-		
-		#Add a const onto the end
-		if 'const' in arglist_suffix:
-			normalised_arg_list_string += ' const'
-		
-		return function_name, normalised_arg_list_string
+		var_args = bool(result.var_args)
+	
+	#If the function contains a variable number of arguments (int foo, ...) then add them on.
+	if var_args:
+		normalised_arg_list.append('...')
 	
-	#TODO Maybe this should raise an exception?
-	return None
+	#Combine all the arguments and put parentheses around it
+	normalised_arg_list_string = ''.join(['(', ', '.join(normalised_arg_list), ')'])
+	
+	#Add a const onto the end
+	if 'const' in arglist_suffix:
+		normalised_arg_list_string += ' const'
+	
+	return None, normalised_arg_list_string
+
+#Below this many distinct symbols a process pool costs more than it saves
+PARALLEL_THRESHOLD = 2000
 
-def normalise_list(list_of_symbols):
-	#normalise_pool = multiprocessing.Pool(multiprocessing.cpu_count() * 2)
-	#results = normalise_pool.map(normalise, list_of_symbols)
-	#normalise_pool.terminate()
-	results = itertools.imap(normalise, list_of_symbols)
-	return results
+def normalise_list(list_of_symbols, processes=0):
+	"""
+	Normalises every symbol of *list_of_symbols* with :py:func:`normalise`, each distinct one only once.
+	
+	:Parameters:
+		list_of_symbols : list of strings
+			The symbols to normalise
+		processes : int
+			If more than 1, the symbols are shared out between that many worker processes
+	
+	:return: a list of the results of :py:func:`normalise`, in the order of *list_of_symbols*
+	"""
+	unique_symbols = list(set(list_of_symbols))
+	if processes > 1 and len(unique_symbols) >= PARALLEL_THRESHOLD:
+		normalise_pool = multiprocessing.Pool(processes)
+		try:
+			results = normalise_pool.map(normalise, unique_symbols, len(unique_symbols) // (processes * 4) + 1)
+		finally:
+			normalise_pool.terminate()
+	else:
+		results = map(normalise, unique_symbols)
+	
+	results = dict(zip(unique_symbols, results))
+	return [results[symbol] for symbol in list_of_symbols]
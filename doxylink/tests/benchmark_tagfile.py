@@ -0,0 +1,70 @@
+"""
+Time and memory benchmark of parse_tag_file on a synthetic tag file.
+
+Usage: python tests/benchmark_tagfile.py [number of members]
+
+Every run parses the file in a fresh process, once from an ElementTree built
+with ET.parse (the way tag files used to be read) and once incrementally, and
+prints the time taken and the peak memory of the process.
+"""
+import os
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+
+MEMBERS_PER_COMPOUND = 50
+
+#(kind, arglist) of the generated members, used in turn
+MEMBER_KINDS = [('variable', ''), ('typedef', ''), ('enumeration', ''), ('function', '()'), ('function', '() const'),
+                ('function', '( const QString &amp; text, int index = -1 )')]
+
+def write_tag_file(path, members):
+	with open(path, 'w') as stream:
+		stream.write("<?xml version='1.0' encoding='ISO-8859-1' standalone='yes' ?>\n<tagfile>\n")
+		for compound in range(members // MEMBERS_PER_COMPOUND):
+			stream.write('  <compound kind="class">\n')
+			stream.write('    <name>Library::Class%d</name>\n' % compound)
+			stream.write('    <filename>class_library_1_1_class%d.html</filename>\n' % compound)
+			for member in range(MEMBERS_PER_COMPOUND):
+				kind, arglist = MEMBER_KINDS[member % len(MEMBER_KINDS)]
+				stream.write('    <member kind="%s">\n' % kind)
+				stream.write('      <type>int</type>\n')
+				stream.write('      <name>member%d</name>\n' % member)
+				stream.write('      <anchorfile>class_library_1_1_class%d.html</anchorfile>\n' % compound)
+				stream.write('      <anchor>a%032x</anchor>\n' % member)
+				stream.write('      <arglist>%s</arglist>\n' % arglist)
+				stream.write('    </member>\n')
+			stream.write('  </compound>\n')
+		stream.write('</tagfile>\n')
+
+def run(mode, path):
+	from sphinxcontrib.doxylink import doxylink
+
+	start = time.time()
+	if mode == 'tree':
+		import xml.etree.ElementTree as ET
+		mapping = doxylink.parse_tag_file(ET.parse(path))
+	else:
+		mapping = doxylink.parse_tag_file(path)
+	elapsed = time.time() - start
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	print('%-12s %d symbols in %.1f s, peak memory %d MB' % (mode, len(mapping), elapsed, peak // 1024))
+
+if __name__ == '__main__':
+	if len(sys.argv) == 3:
+		run(sys.argv[1], sys.argv[2])
+		sys.exit()
+
+	members = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+	fd, path = tempfile.mkstemp(suffix='.tag')
+	os.close(fd)
+	try:
+		write_tag_file(path, members)
+		print('%d members, %d MB tag file' % (members, os.path.getsize(path) // (1024 * 1024)))
+		for mode in ('tree', 'incremental'):
+			subprocess.check_call([sys.executable, __file__, mode, path])
+	finally:
+		os.remove(path)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sphinxcontrib.doxylink import doxylink
+
+tag_file = """<?xml version='1.0' encoding='ISO-8859-1' standalone='yes' ?>
+<tagfile>
+  <compound kind="class">
+    <name>PolyVox::Volume</name>
+    <filename>class_poly_vox_1_1_volume.html</filename>
+    <member kind="function">
+      <type>int</type>
+      <name>getDepth</name>
+      <anchorfile>class_poly_vox_1_1_volume.html</anchorfile>
+      <anchor>a2</anchor>
+      <arglist>() const</arglist>
+    </member>
+  </compound>
+</tagfile>
+"""
+
+class TestLoadTagFile(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.cache_dir = os.path.join(self.dir, 'cache')
+		self.tag_filename = os.path.join(self.dir, 'PolyVox.tag')
+		with open(self.tag_filename, 'w') as stream:
+			stream.write(tag_file)
+		self.parse_tag_file = doxylink.parse_tag_file
+
+	def tearDown(self):
+		doxylink.parse_tag_file = self.parse_tag_file
+		shutil.rmtree(self.dir)
+
+	def test_without_cache(self):
+		self.assertEqual(doxylink.load_tag_file(self.tag_filename), doxylink.parse_tag_file(self.tag_filename))
+
+	def test_cached(self):
+		mapping = doxylink.load_tag_file(self.tag_filename, self.cache_dir)
+		self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+		
+		def fail(*args):
+			self.fail('Tag file parsed again')
+		doxylink.parse_tag_file = fail
+		self.assertEqual(doxylink.load_tag_file(self.tag_filename, self.cache_dir), mapping)
+		self.assertEqual(mapping['PolyVox::Volume::getDepth']['arglist'], {'() const' : 'class_poly_vox_1_1_volume.html#a2'})
+
+	def test_content_changed(self):
+		doxylink.load_tag_file(self.tag_filename, self.cache_dir)
+		with open(self.tag_filename, 'w') as stream:
+			stream.write(tag_file.replace('getDepth', 'getWidth'))
+		mapping = doxylink.load_tag_file(self.tag_filename, self.cache_dir)
+		self.assertTrue('PolyVox::Volume::getWidth' in mapping)
+		self.assertEqual(len(os.listdir(self.cache_dir)), 2)
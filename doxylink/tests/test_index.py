@@ -0,0 +1,47 @@
+import unittest
+
+from sphinxcontrib.doxylink import doxylink
+
+mapping = {'PolyVox' : {'kind' : 'namespace', 'file' : 'namespace_poly_vox.html'},
+           'PolyVox::Volume' : {'kind' : 'class', 'file' : 'class_poly_vox_1_1_volume.html'},
+           'PolyVox::Volume::Volume' : {'kind' : 'function', 'arglist' : {'()' : 'class_poly_vox_1_1_volume.html#a1'}},
+           'PolyVox::Volume::getDepth' : {'kind' : 'function', 'arglist' : {'()' : 'class_poly_vox_1_1_volume.html#a2'}},
+           'PolyVox::Array' : {'kind' : 'class', 'file' : 'class_poly_vox_1_1_array.html'},
+           'PolyVox::Array< 1, ElementType >' : {'kind' : 'class', 'file' : 'class_poly_vox_1_1_array_3_011_00_01_element_type_01_4.html'},
+           'PolyVox::Array::operator[]' : {'kind' : 'function', 'arglist' : {'(uint32_t)' : 'class_poly_vox_1_1_array.html#a3'}},
+           'PolyVox::Array< 1, ElementType >::operator[]' : {'kind' : 'function', 'arglist' : {'(uint32_t)' : 'class_poly_vox_1_1_array_3_011_00_01_element_type_01_4.html#a4'}},
+           'Other::Volume' : {'kind' : 'typedef', 'file' : 'namespace_other.html#a5'},
+}
+
+symbols = ['Volume', 'PolyVox::Volume', 'Volume::getDepth', 'getDepth', 'operator[]', 'Array::operator[]',
+           'Foo::PolyVox::Volume', 'Array', 'Missing', 'Other::Volume', 'ElementType >::operator[]']
+
+def find_url_scan(mapping, symbol):
+	"""The lookup of find_url2 done by scanning the whole mapping"""
+	piecewise_list = doxylink.find_url_piecewise(mapping, symbol)
+	if len(piecewise_list) == 1:
+		return piecewise_list.keys()
+	classes_list = doxylink.find_url_classes(piecewise_list, symbol)
+	if len(classes_list) == 1:
+		return classes_list.keys()
+	if len(classes_list) == 0:
+		classes_list = piecewise_list
+	return doxylink.find_url_remove_templates(classes_list, symbol).keys() or [None]
+
+class TestSymbolIndex(unittest.TestCase):
+	def setUp(self):
+		self.index = doxylink.SymbolIndex(mapping)
+
+	def test_same_as_scan(self):
+		for symbol in symbols:
+			self.assertTrue(self.index.find(symbol) in find_url_scan(mapping, symbol), symbol)
+
+	def test_prefer_classes(self):
+		self.assertEqual(self.index.find('Volume'), 'PolyVox::Volume')
+
+	def test_remove_templates(self):
+		self.assertEqual(self.index.find('operator[]'), 'PolyVox::Array::operator[]')
+
+	def test_find_url2(self):
+		for symbol in symbols:
+			self.assertEqual(doxylink.find_url2(mapping, symbol, self.index), doxylink.find_url2(mapping, symbol))
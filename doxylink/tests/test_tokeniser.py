@@ -0,0 +1,66 @@
+import unittest
+import itertools
+
+from sphinxcontrib.doxylink import parsing
+
+from test_parser import arglists, varargs, multiple_qualifiers, numbers_for_defaults, flags_in_defaults
+
+#Argument lists the pyparsing grammar handles in surprising ways, or not at all
+odd_arglists = ['(const unsigned int x)', '(constIterator it)', '(int constant)', '(int * const p)', '( )', '(vector <int> v)',
+                '(A<B>::C<D> x)', '(int x) foo )', '(int x = a + b)', '(int ***p)', '(...)', '(int a, ...)', '(Foo<>)',
+                '(X< A<B>::C > y)', '(int (*fn)(int))', '(int a[3][4])', '(unsigned long int x)', '(int&& r)', '(Foo< "a" > x)',
+                '(struct::x y)', '(int a, )', '(int a = )', '(int a, ...) const', '(Foo<int x)', '(int f(x)', '(int\tx,\nint y)']
+
+#Pieces combined into one argument each: qualifier, type, pointers and const, name and default value
+qualifiers = ['', 'const ', 'typename ']
+types = ['int', 'Qt::WindowFlags', 'Array< noOfDims, ElementType >', 'SharedPtr<ControllerValue<T> >', 'Q3ValueList<T>::size_type']
+modifiers = ['', '*', ' & ', '**', ' const *', '*const*']
+names = ['', ' name', '(&pDimensions)[noOfDims]', ' x[3]']
+defaults = ['', '=0', ' = -1', ' = QUrl()', ' = ExactMatch | Qt::CaseSensitive', '=(std::numeric_limits< uint32_t >::max)()']
+
+def generated_arglists():
+	for pieces in itertools.product(qualifiers, types, modifiers, names, defaults):
+		yield '(%s%s%s%s%s)' % pieces
+		yield '( int first, %s%s%s%s%s, ... ) const' % pieces
+
+class TestTokeniser(unittest.TestCase):
+	def assertSameAsGrammar(self, arglist):
+		self.assertEqual(parsing.normalise_arglist(arglist), parsing.normalise_arglist(arglist, tokenise=False), arglist)
+
+	def test_known_arglists(self):
+		for arglist, _ in arglists + varargs + multiple_qualifiers + numbers_for_defaults + flags_in_defaults:
+			self.assertSameAsGrammar(arglist)
+
+	def test_odd_arglists(self):
+		for arglist in odd_arglists:
+			self.assertSameAsGrammar(arglist)
+
+	def test_generated_arglists(self):
+		for arglist in generated_arglists():
+			self.assertSameAsGrammar(arglist)
+
+	def test_tokenised(self):
+		#The common forms must not need pyparsing
+		for arglist, _ in numbers_for_defaults + flags_in_defaults:
+			parsing.tokenise_arglist(arglist)
+		self.assertRaises(parsing.UnsupportedArglist, parsing.tokenise_arglist, '(const unsigned int x)')
+
+class TestNormaliseList(unittest.TestCase):
+	def setUp(self):
+		self.symbols = [arglist for arglist, _ in arglists] * 2 + odd_arglists
+
+	def test_cached(self):
+		self.assertEqual(parsing.normalise('foo( QUrl source )'), ('foo', '(QUrl)'))
+		self.assertEqual(parsing.arglist_cache['( QUrl source )'], (None, '(QUrl)'))
+		self.assertEqual(parsing.normalise('bar( QUrl source )'), ('bar', '(QUrl)'))
+
+	def test_serial(self):
+		self.assertEqual(parsing.normalise_list(self.symbols), [parsing.normalise(symbol) for symbol in self.symbols])
+
+	def test_processes(self):
+		threshold = parsing.PARALLEL_THRESHOLD
+		parsing.PARALLEL_THRESHOLD = 0
+		try:
+			self.assertEqual(parsing.normalise_list(self.symbols, 2), parsing.normalise_list(self.symbols))
+		finally:
+			parsing.PARALLEL_THRESHOLD = threshold
@@ -13,6 +13,7 @@
 import posixpath
 import os
 import codecs
+from subprocess import Popen, PIPE
 try:
     from hashlib import sha1 as sha
 except ImportError:
@@ -73,6 +74,13 @@ class GoogleChartBase(Directive):
         if 'size' in self.options:
             node['options']['size'] = self.options['size']
 
+        # remember the chart to fetch it together with the others
+        env = self.state.document.settings.env
+        if not hasattr(env, 'googlechart_charts'):
+            env.googlechart_charts = {}
+        env.googlechart_charts.setdefault(env.docname, []).append(
+            (dotcode, node['options']))
+
         return [node]
 
 
@@ -145,16 +153,14 @@ def get_image_filename(self, code, options, prefix='google_chart'):
     """
     Get path of output file.
     """
-    hashkey = code.encode('utf-8') + str(options)
-    fname = '%s-%s.png' % (prefix, sha(hashkey).hexdigest())
+    fname = get_image_name(self.builder, code, options, prefix)
     if hasattr(self.builder, 'imgpath'):
         # HTML
         relfn = posixpath.join(self.builder.imgpath, fname)
-        outfn = os.path.join(self.builder.outdir, '_images', fname)
     else:
         # LaTeX
         relfn = fname
-        outfn = os.path.join(self.builder.outdir, fname)
+    outfn = get_output_filename(self.builder, fname)
 
     if os.path.isfile(outfn):
         return relfn, outfn
@@ -164,21 +170,162 @@ def get_image_filename(self, code, options, prefix='google_chart'):
     return relfn, outfn
 
 
-def create_google_chart(self, code, filename, options, prefix='google_chart'):
+def get_image_name(builder, code, options, prefix='google_chart'):
     """
-    Render google_chart code into a image file.
+    Get name of output file; charts drawn locally are saved as SVG, which is
+    converted to PDF for builders other than HTML.
     """
+    hashkey = code.encode('utf-8') + str(options)
+    if is_local_chart(builder, code, options):
+        if builder.format == 'html':
+            ext = 'svg'
+        else:
+            ext = 'pdf'
+    else:
+        ext = 'png'
+
+    return '%s-%s.%s' % (prefix, sha(hashkey).hexdigest(), ext)
+
+
+def is_local_chart(builder, code, options):
+    """
+    True if the chart should be drawn by the local renderer.
+    """
+    if builder.config.googlechart_renderer != 'local':
+        return False
+
+    return get_google_chart(builder, code, options).renderable
+
+
+def get_output_filename(builder, fname):
+    """
+    Get path of output file, also before the builder starts writing.
+    """
+    if builder.format == 'html':
+        return os.path.join(builder.outdir, '_images', fname)
+    else:
+        return os.path.join(builder.outdir, fname)
+
+
+def get_fetcher(builder):
+    """
+    Get the chart fetcher shared by the whole build.
+    """
+    if not hasattr(builder, '_googlechart_fetcher'):
+        builder._googlechart_fetcher = core.ChartFetcher()
+    return builder._googlechart_fetcher
+
+
+def get_google_chart(builder, code, options):
     kwargs = {}
     if options.has_key('size'):
         kwargs['size'] = options['size']
 
+    return core.GoogleChart(code, 'chart',
+                            baseurl=builder.config.googlechart_endpoint,
+                            **kwargs)
+
+
+def create_google_chart(self, code, filename, options, prefix='google_chart'):
+    """
+    Render google_chart code into a image file.
+    """
+    errors = getattr(self.builder, '_googlechart_errors', {})
+    if filename in errors:
+        # already failed while prefetching
+        raise GoogleChartError(errors[filename])
+
     try:
-        chart = core.GoogleChart(code, 'chart', **kwargs)
-        chart.save(filename)
+        chart = get_google_chart(self.builder, code, options)
+        if filename.endswith('.svg'):
+            chart.save_svg(filename)
+        elif filename.endswith('.pdf'):
+            convert_svg(self.builder, chart, filename)
+        else:
+            chart.save(filename, get_fetcher(self.builder))
+    except GoogleChartError:
+        raise
     except Exception, e:
         raise GoogleChartError(e)
 
 
+def convert_svg(builder, chart, filename):
+    """
+    Draw chart as SVG and convert it into the PDF file *filename* with the
+    googlechart_svg_converter command.
+    """
+    svgfn = filename + '.svg'
+    chart.save_svg(svgfn)
+    try:
+        converter = builder.config.googlechart_svg_converter
+        try:
+            p = Popen([converter, '-f', 'pdf', '-o', filename, svgfn],
+                      stdout=PIPE, stderr=PIPE)
+        except OSError, err:
+            if err.errno != ENOENT:
+                raise
+            raise GoogleChartError('SVG converter %r cannot be run (needed '
+                                   'to include charts drawn locally), check '
+                                   'the googlechart_svg_converter setting' %
+                                   converter)
+        stdout, stderr = p.communicate()
+        if p.returncode != 0 or not os.path.isfile(filename):
+            raise GoogleChartError('SVG converter exited with error:\n'
+                                   '[stderr]\n%s' % stderr)
+    finally:
+        os.remove(svgfn)
+
+
+def prefetch_google_charts(app, env):
+    """
+    Fetch all charts which are not rendered yet, concurrently, before the
+    builder starts writing.
+    """
+    builder = app.builder
+    if builder.format not in ('html', 'latex'):
+        return
+
+    requests = {}
+    for charts in getattr(env, 'googlechart_charts', {}).values():
+        for code, options in charts:
+            fname = get_image_name(builder, code, options)
+            if not fname.endswith('.png'):
+                continue  # drawn locally by the visitor
+
+            outfn = get_output_filename(builder, fname)
+            if os.path.isfile(outfn) or outfn in requests:
+                continue
+
+            try:
+                url = get_google_chart(builder, code, options).url
+            except Exception:
+                continue  # reported by the visitor
+
+            requests[outfn] = url
+
+    if not requests:
+        return
+
+    for outfn in requests:
+        ensuredir(os.path.dirname(outfn))
+
+    fetcher = get_fetcher(builder)
+    builder._googlechart_errors = fetcher.fetch_all(
+        [(url, outfn) for outfn, url in requests.items()],
+        builder.config.googlechart_max_connections)
+
+
+def purge_google_charts(app, env, docname):
+    if hasattr(env, 'googlechart_charts'):
+        env.googlechart_charts.pop(docname, None)
+
+
+def close_fetcher(app, exception):
+    if hasattr(app.builder, '_googlechart_fetcher'):
+        app.builder._googlechart_fetcher.close()
+        del app.builder._googlechart_fetcher
+
+
 def render_dot_html(self, node, code, options, prefix='google_chart',
                     imgcls=None, alt=None):
     has_thumbnail = False
@@ -211,7 +358,8 @@ def html_visit_google_chart(self, node):
 def render_dot_latex(self, node, code, options, prefix='google_chart'):
     try:
         fname, outfn = get_image_filename(self, code, options, prefix)
-        create_google_chart(self, code, outfn, options, prefix)
+        if not os.path.isfile(outfn):
+            create_google_chart(self, code, outfn, options, prefix)
     except GoogleChartError, exc:
         self.builder.warn('dot code %r: ' % code + str(exc))
         raise nodes.SkipNode
@@ -241,3 +389,10 @@ def setup(app):
     app.add_directive('venndiagram', VennDiagram)
     app.add_directive('plotchart', PlotChart)
     app.add_directive('mapchart', MapChart)
+    app.add_config_value('googlechart_endpoint', None, 'html')
+    app.add_config_value('googlechart_max_connections', 4, 'html')
+    app.add_config_value('googlechart_renderer', 'remote', 'html')
+    app.add_config_value('googlechart_svg_converter', 'rsvg-convert', 'html')
+    app.connect('env-purge-doc', purge_google_charts)
+    app.connect('env-updated', prefetch_google_charts)
+    app.connect('build-finished', close_fetcher)
@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import re
+import socket
 import urllib
+import httplib
+import urlparse
+import threading
+import Queue
+import svg
 import regions
 from parser import parse_string
 
@@ -10,24 +16,130 @@ class GoogleChartError(Exception):
     pass
 
 
+class ChartFetcher(object):
+    """
+    Fetches chart images over keep-alive connections.
+
+    Every thread gets its own connection per host, so charts can be fetched
+    concurrently with fetch_all().
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def _connection(self, scheme, netloc):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+
+        key = (scheme, netloc)
+        if key not in self.local.connections:
+            if scheme == 'https':
+                conn = httplib.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                conn = httplib.HTTPConnection(netloc, timeout=self.timeout)
+            self.local.connections[key] = conn
+            self.lock.acquire()
+            try:
+                self.connections.append(conn)
+            finally:
+                self.lock.release()
+
+        return self.local.connections[key]
+
+    def fetch(self, url):
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        # the server may have dropped an idle connection; retry once
+        for retry in (False, True):
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                del self.local.connections[(parts.scheme, parts.netloc)]
+                if retry:
+                    raise
+
+        if response.status != 200:
+            msg = "google chart error: a malformed or illegal request"
+            raise GoogleChartError(msg)
+
+        return body
+
+    def fetch_all(self, requests, workers):
+        """
+        Fetch ``(url, filename)`` pairs with at most *workers* concurrent
+        requests. Returns a dict of filename to exception for the failed
+        ones.
+        """
+        queue = Queue.Queue()
+        for request in requests:
+            queue.put(request)
+
+        errors = {}
+
+        def worker():
+            while True:
+                try:
+                    url, filename = queue.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    body = self.fetch(url)
+                    open(filename, 'wb').write(body)
+                except Exception, e:
+                    errors[filename] = e
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(max(1, min(workers, queue.qsize())))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return errors
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+
 class GoogleChart(object):
     baseurl = 'https://chart.googleapis.com/chart?'
 
-    def __init__(self, code, format, **options):
+    def __init__(self, code, format, baseurl=None, **options):
         self.code = code
         self.format = format
         self.options = options
+        if baseurl:
+            if not baseurl.endswith(('?', '&')):
+                baseurl += '&' if '?' in baseurl else '?'
+            self.baseurl = baseurl
 
     @property
-    def url(self):
+    def params(self):
         if self.format == 'chart':
-            params = self._url_for_chart()
+            return self._url_for_chart()
         elif self.format == 'graphviz':
-            params = self._url_for_graphviz()
+            return self._url_for_graphviz()
         else:
             msg = "unknown format: %s" % self.format
             raise GoogleChartError(msg)
 
+    @property
+    def url(self):
+        params = self.params
         quoted = ("%s=%s" % (k, urllib.quote(v)) for k, v in params.items())
         url = self.baseurl + "&".join(quoted)
 
@@ -184,7 +296,40 @@ class GoogleChart(object):
 
         return params
 
-    def save(self, filename):
+    @property
+    def renderable(self):
+        """
+        True if the chart can be drawn by the local SVG renderer.
+        """
+        if self.format != 'chart':
+            return False
+
+        try:
+            return parse_string(self.code).type in svg.SUPPORTED_TYPES
+        except Exception:
+            return False
+
+    def save_svg(self, filename):
+        try:
+            source = svg.render(self.params)
+        except svg.SVGRenderError, e:
+            raise GoogleChartError(str(e))
+
+        open(filename, 'wb').write(source.encode('utf-8'))
+
+    def save(self, filename, fetcher=None):
+        if fetcher is not None:
+            try:
+                body = fetcher.fetch(self.url)
+            except GoogleChartError:
+                raise
+            except Exception:
+                msg = "google chart error: a malformed or illegal request"
+                raise GoogleChartError(msg)
+
+            open(filename, 'wb').write(body)
+            return
+
         try:
             fd = urllib.urlopen(self.url)
 
@@ -12,7 +12,12 @@
 
 import posixpath
 import os
+import shutil
 import codecs
+import tempfile
+import threading
+import Queue
+from subprocess import Popen, PIPE
 try:
     from hashlib import sha1 as sha
 except ImportError:
@@ -25,6 +30,7 @@ from sphinx.errors import SphinxError
 from sphinx.util.osutil import ensuredir, ENOENT, EPIPE
 from sphinx.util.compat import Directive
 
+from sphinxcontrib.googlechart import get_fetcher, close_fetcher
 from sphinxcontrib.googlechart.core import GoogleChart
 
 
@@ -93,6 +99,13 @@ class GraphvizBase(Directive):
         if 'size' in self.options:
             node['options']['size'] = self.options['size']
 
+        # remember the graph to render it together with the others
+        env = self.state.document.settings.env
+        if not hasattr(env, 'googlechart_graphs'):
+            env.googlechart_graphs = {}
+        env.googlechart_graphs.setdefault(env.docname, []).append(
+            (dotcode, node['options']))
+
         return [node]
 
 
@@ -144,22 +157,31 @@ def relfn2path(env, filename, docname=None):
         return rel_fn, os.path.join(env.srcdir, enc_rel_fn)
 
 
-def get_image_filename(self, code, options, prefix='graphviz'):
+def get_image_name(code, options, prefix='graphviz'):
+    hashkey = code.encode('utf-8') + str(options)
+    return '%s-%s.png' % (prefix, sha(hashkey).hexdigest())
+
+
+def get_output_dir(builder):
     """
-    Get path of output file.
+    Get directory of output files, also before the builder starts writing.
     """
-    hashkey = code.encode('utf-8') + str(options)
-    fname = '%s-%s.png' % (prefix, sha(hashkey).hexdigest())
-    if hasattr(self.builder, 'imagedir'):  # Sphinx (>= 1.3.x)
-        outputdir = os.path.join(self.builder.outdir, self.builder.imagedir)
-    elif hasattr(self.builder, 'imgpath'):  # Sphinx (<= 1.2.x) and HTML writer
-        outputdir = os.path.join(self.builder.outdir, '_images')
+    if hasattr(builder, 'imagedir'):  # Sphinx (>= 1.3.x)
+        return os.path.join(builder.outdir, builder.imagedir)
+    elif builder.format == 'html':  # Sphinx (<= 1.2.x) and HTML writer
+        return os.path.join(builder.outdir, '_images')
     else:
-        outputdir = self.builder.outdir
+        return builder.outdir
 
+
+def get_image_filename(self, code, options, prefix='graphviz'):
+    """
+    Get path of output file.
+    """
+    fname = get_image_name(code, options, prefix)
     reldir = getattr(self.builder, 'imgpath', '')
     relfn = os.path.join(reldir, fname)
-    outfn = os.path.join(outputdir, fname)
+    outfn = os.path.join(get_output_dir(self.builder), fname)
 
     if os.path.isfile(outfn):
         return relfn, outfn
@@ -169,13 +191,137 @@ def get_image_filename(self, code, options, prefix='graphviz'):
     return relfn, outfn
 
 
+def run_dot(builder, graphs, options):
+    """
+    Render ``(code, filename)`` pairs sharing the same *options* with a
+    single dot process. Returns error messages of dot, if any.
+    """
+    dot_args = [builder.config.googlechart_graphviz_dot, '-Tpng', '-O',
+                '-K%s' % options.get('type', 'dot')]
+    if options.get('size'):
+        # dot sizes graphs in inches
+        try:
+            width, height = options['size'].lower().split('x')
+            width, height = int(width), int(height)
+        except ValueError:
+            raise GraphvizError('invalid size: %r' % options['size'])
+        dot_args.extend(['-Gdpi=96', '-Gsize=%.2f,%.2f' %
+                         (width / 96.0, height / 96.0)])
+
+    tmpdir = tempfile.mkdtemp(prefix='googlechart-graphviz-')
+    try:
+        inputs = []
+        for index, (code, filename) in enumerate(graphs):
+            path = os.path.join(tmpdir, '%d.dot' % index)
+            fp = codecs.open(path, 'w', 'utf-8')
+            try:
+                fp.write(code)
+            finally:
+                fp.close()
+            inputs.append((path, filename))
+
+        try:
+            p = Popen(dot_args + [path for path, _ in inputs],
+                      stdout=PIPE, stderr=PIPE)
+        except OSError, err:
+            if err.errno != ENOENT:
+                raise
+            raise GraphvizError('dot command %r cannot be run (needed for '
+                                'graphviz output), check the '
+                                'googlechart_graphviz_dot setting' %
+                                builder.config.googlechart_graphviz_dot)
+        stdout, stderr = p.communicate()
+
+        # dot keeps rendering the other inputs when one of them is broken
+        for path, filename in inputs:
+            if os.path.isfile(path + '.png'):
+                ensuredir(os.path.dirname(filename))
+                shutil.move(path + '.png', filename)
+    finally:
+        shutil.rmtree(tmpdir, True)
+
+    return stderr
+
+
+def render_pending_graphs(app, env):
+    """
+    Render all graphs which are not rendered yet with the local dot before
+    the builder starts writing. Every worker renders a whole chunk of the
+    graphs with one dot process.
+    """
+    builder = app.builder
+    if builder.config.googlechart_graphviz_backend != 'local':
+        return
+    if builder.format not in ('html', 'latex'):
+        return
+
+    pending = {}
+    outputdir = get_output_dir(builder)
+    for graphs in getattr(env, 'googlechart_graphs', {}).values():
+        for code, options in graphs:
+            outfn = os.path.join(outputdir, get_image_name(code, options))
+            if os.path.isfile(outfn):
+                continue
+
+            key = tuple(sorted(options.items()))
+            pending.setdefault(key, {})[outfn] = code
+
+    workers = builder.config.googlechart_graphviz_jobs
+    if not workers:
+        try:
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+        except (ImportError, NotImplementedError):
+            workers = 1
+
+    queue = Queue.Queue()
+    for key, graphs in pending.items():
+        graphs = [(code, outfn) for outfn, code in graphs.items()]
+        size = (len(graphs) + workers - 1) // workers
+        for i in range(0, len(graphs), size):
+            queue.put((dict(key), graphs[i:i + size]))
+
+    def worker():
+        while True:
+            try:
+                options, graphs = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                run_dot(builder, graphs, options)
+            except Exception:
+                continue  # failed graphs are reported by the visitors
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(workers, queue.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def purge_graphs(app, env, docname):
+    if hasattr(env, 'googlechart_graphs'):
+        env.googlechart_graphs.pop(docname, None)
+
+
 def create_graphviz(self, code, filename, options, prefix='graphviz'):
     """
     Render graphviz code into a image file.
     """
+    if self.builder.config.googlechart_graphviz_backend == 'local':
+        stderr = run_dot(self.builder, [(code, filename)], options)
+        if not os.path.isfile(filename):
+            raise GraphvizError('dot exited with error:\n[stderr]\n%s' %
+                                stderr)
+        return
+
     try:
-        chart = GoogleChart(code, 'graphviz', type=options.get('type', 'dot'), size=options.get('size'))
-        chart.save(filename)
+        baseurl = getattr(self.builder.config, 'googlechart_endpoint', None)
+        chart = GoogleChart(code, 'graphviz', baseurl=baseurl,
+                            type=options.get('type', 'dot'), size=options.get('size'))
+        chart.save(filename, get_fetcher(self.builder))
     except:
         raise GraphvizError('graphviz error: a malformed or illegal request:')
 
@@ -233,3 +379,9 @@ def setup(app):
     app.add_directive('graphviz', Graphviz)
     app.add_directive('graph', Graphviz_Graph)
     app.add_directive('digraph', Graphviz_Digraph)
+    app.add_config_value('googlechart_graphviz_backend', 'remote', 'html')
+    app.add_config_value('googlechart_graphviz_dot', 'dot', 'html')
+    app.add_config_value('googlechart_graphviz_jobs', None, 'html')
+    app.connect('env-purge-doc', purge_graphs)
+    app.connect('env-updated', render_pending_graphs)
+    app.connect('build-finished', close_fetcher)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.googlechart.svg
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Render pie, line and bar charts as SVG without the Google Chart API.
+    Charts are drawn from the same parameters that are sent to the API.
+
+    :copyright: Copyright 2010 by Takeshi Komiya.
+    :license: BSDL.
+"""
+
+import math
+from xml.sax.saxutils import escape, quoteattr
+
+
+# default colors of the Google Chart API
+PALETTE = ['FF9900', '3399CC', '80C65A', 'DE4D4E', '990066', 'FFCC00',
+           '76A4FB', '224499', 'AA0033', '4D89F9']
+
+FONT_SIZE = 11
+MARGIN = 10
+AXIS_WIDTH = 30
+LEGEND_ENTRY = 16
+
+SUPPORTED_TYPES = ('p', 'p3', 'lc', 'lxy', 'bhs', 'bvs', 'bhg', 'bvg')
+
+
+class SVGRenderError(Exception):
+    pass
+
+
+def render(params):
+    """
+    Return SVG source of the chart described by Google Chart API *params*.
+    """
+    chart_type = params.get('cht')
+    if chart_type not in SUPPORTED_TYPES:
+        msg = "chart type %r is not supported by the local renderer" % \
+              chart_type
+        raise SVGRenderError(msg)
+
+    canvas = Canvas(*parse_size(params.get('chs', '320x240')))
+    if chart_type in ('p', 'p3'):
+        draw_piechart(canvas, params)
+    elif chart_type in ('lc', 'lxy'):
+        draw_linechart(canvas, params)
+    else:
+        draw_barchart(canvas, params)
+
+    return canvas.to_svg()
+
+
+def parse_size(size):
+    try:
+        width, height = size.lower().split('x')
+        return int(width), int(height)
+    except ValueError:
+        raise SVGRenderError("invalid chart size: %r" % size)
+
+
+def parse_data(params):
+    data = params.get('chd', 't:')
+    if not data.startswith('t:'):
+        raise SVGRenderError("unsupported data encoding: %r" % data)
+
+    series = []
+    for values in data[2:].split('|'):
+        try:
+            series.append([float(v) for v in values.split(',') if v])
+        except ValueError:
+            raise SVGRenderError("invalid chart data: %r" % values)
+
+    return series
+
+
+def parse_list(params, name, separator='|'):
+    value = params.get(name)
+    if not value:
+        return []
+
+    return value.split(separator)
+
+
+def parse_colors(params, count):
+    colors = parse_list(params, 'chco', ',')
+    colors += PALETTE[len(colors):]
+    while len(colors) < count:
+        colors += PALETTE
+
+    return ['#' + c[:6] for c in colors[:count]]
+
+
+def parse_axes(params):
+    """
+    Return a dict of axis type ('x', 'y', 'r' or 't') to its labels.
+    """
+    axes = parse_list(params, 'chxt', ',')
+    labels = {}
+    index = None
+    for item in parse_list(params, 'chxl'):
+        if item.endswith(':') and item[:-1].isdigit():
+            index = int(item[:-1])
+            labels[index] = []
+        elif index is not None:
+            labels[index].append(item)
+
+    return dict((axis, labels.get(i, [])) for i, axis in enumerate(axes))
+
+
+def scale(value, length):
+    # text encoded data is drawn on a 0-100 scale, like the API does
+    return max(0.0, min(value, 100.0)) * length / 100.0
+
+
+class Canvas(object):
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.elements = []
+
+    def add(self, tag, text=None, **attrs):
+        attributes = ''.join(' %s=%s' % (k.replace('_', '-'), quoteattr(str(v)))
+                             for k, v in sorted(attrs.items()))
+        if text is None:
+            self.elements.append('<%s%s/>' % (tag, attributes))
+        else:
+            self.elements.append('<%s%s>%s</%s>' %
+                                 (tag, attributes, escape(text), tag))
+
+    def text(self, x, y, text, anchor='start'):
+        self.add('text', text, x='%.1f' % x, y='%.1f' % y,
+                 font_size=FONT_SIZE, font_family='sans-serif',
+                 text_anchor=anchor, fill='#333333')
+
+    def line(self, x1, y1, x2, y2, color='#666666', width=1):
+        self.add('line', x1='%.1f' % x1, y1='%.1f' % y1, x2='%.1f' % x2,
+                 y2='%.1f' % y2, stroke=color, stroke_width=width)
+
+    def rect(self, x, y, width, height, color):
+        self.add('rect', x='%.1f' % x, y='%.1f' % y, width='%.1f' % width,
+                 height='%.1f' % height, fill=color)
+
+    def to_svg(self):
+        header = ('<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+                  'width="%d" height="%d" viewBox="0 0 %d %d">' %
+                  (self.width, self.height, self.width, self.height))
+        background = ('<rect x="0" y="0" width="%d" height="%d" '
+                      'fill="#ffffff"/>' % (self.width, self.height))
+        return '\n'.join([header, background] + self.elements + ['</svg>'])
+
+
+def draw_legend(canvas, labels, colors):
+    """
+    Draw a legend at the right side and return its width.
+    """
+    if not labels:
+        return 0
+
+    width = max(len(label) for label in labels) * FONT_SIZE * 0.6 + 20
+    x = canvas.width - width - MARGIN
+    y = (canvas.height - len(labels) * LEGEND_ENTRY) / 2.0
+    for label, color in zip(labels, colors):
+        canvas.rect(x, y, 10, 10, color)
+        canvas.text(x + 14, y + 9, label)
+        y += LEGEND_ENTRY
+
+    return width + MARGIN
+
+
+def draw_piechart(canvas, params):
+    values = parse_data(params)[0]
+    labels = parse_list(params, 'chl')
+    colors = parse_colors(params, len(values))
+    total = sum(v for v in values if v > 0)
+    if not total:
+        return
+
+    cx = canvas.width / 2.0
+    cy = canvas.height / 2.0
+    radius = min(canvas.width, canvas.height) / 2.0 - MARGIN * 3
+
+    angle = -math.pi / 2
+    for i, value in enumerate(values):
+        # empty slices are not drawn, but keep their labels and colors
+        if value <= 0:
+            continue
+        sweep = 2 * math.pi * value / total
+        if sweep >= 2 * math.pi - 1e-9:
+            canvas.add('circle', cx='%.1f' % cx, cy='%.1f' % cy,
+                       r='%.1f' % radius, fill=colors[i])
+        else:
+            x1 = cx + radius * math.cos(angle)
+            y1 = cy + radius * math.sin(angle)
+            x2 = cx + radius * math.cos(angle + sweep)
+            y2 = cy + radius * math.sin(angle + sweep)
+            large = sweep > math.pi and 1 or 0
+            path = 'M %.1f %.1f L %.1f %.1f A %.1f %.1f 0 %d 1 %.1f %.1f Z' % \
+                   (cx, cy, x1, y1, radius, radius, large, x2, y2)
+            canvas.add('path', d=path, fill=colors[i], stroke='#ffffff')
+
+        if i < len(labels):
+            middle = angle + sweep / 2
+            x = cx + (radius + 6) * math.cos(middle)
+            y = cy + (radius + 6) * math.sin(middle) + FONT_SIZE / 3.0
+            anchor = math.cos(middle) < 0 and 'end' or 'start'
+            canvas.text(x, y, labels[i], anchor)
+
+        angle += sweep
+
+
+class PlotArea(object):
+    """
+    The area inside the axes, in canvas coordinates.
+    """
+
+    def __init__(self, canvas, axes, legend_width):
+        self.left = MARGIN + ('y' in axes and AXIS_WIDTH or 0)
+        self.right = canvas.width - MARGIN - legend_width
+        self.top = MARGIN
+        self.bottom = canvas.height - MARGIN - \
+            ('x' in axes and FONT_SIZE + 6 or 0)
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+
+def draw_axes(canvas, area, axes):
+    canvas.line(area.left, area.bottom, area.right, area.bottom)
+    canvas.line(area.left, area.top, area.left, area.bottom)
+
+    labels = axes.get('x', [])
+    for i, label in enumerate(labels):
+        if len(labels) > 1:
+            x = area.left + area.width * i / float(len(labels) - 1)
+        else:
+            x = area.left + area.width / 2.0
+        canvas.text(x, area.bottom + FONT_SIZE + 2, label, 'middle')
+
+    labels = axes.get('y', [])
+    for i, label in enumerate(labels):
+        if len(labels) > 1:
+            y = area.bottom - area.height * i / float(len(labels) - 1)
+        else:
+            y = area.bottom - area.height / 2.0
+        canvas.text(area.left - 4, y + FONT_SIZE / 3.0, label, 'end')
+
+
+def draw_linechart(canvas, params):
+    series = parse_data(params)
+    if params['cht'] == 'lxy':
+        # x and y values come in pairs of series
+        lines = [(series[i], series[i + 1])
+                 for i in range(0, len(series) - 1, 2)]
+    else:
+        lines = []
+        for values in series:
+            count = max(len(values) - 1, 1)
+            lines.append(([i * 100.0 / count for i in range(len(values))],
+                          values))
+
+    colors = parse_colors(params, len(lines))
+    axes = parse_axes(params)
+    legend_width = draw_legend(canvas, parse_list(params, 'chdl'), colors)
+    area = PlotArea(canvas, axes, legend_width)
+    draw_axes(canvas, area, axes)
+
+    for (xs, ys), color in zip(lines, colors):
+        points = ' '.join('%.1f,%.1f' % (area.left + scale(x, area.width),
+                                          area.bottom - scale(y, area.height))
+                          for x, y in zip(xs, ys))
+        canvas.add('polyline', points=points, fill='none', stroke=color,
+                   stroke_width=2)
+
+
+def draw_barchart(canvas, params):
+    chart_type = params['cht']
+    horizontal = chart_type.startswith('bh')
+    stacked = chart_type.endswith('s')
+
+    series = parse_data(params)
+    colors = parse_colors(params, len(series))
+    axes = parse_axes(params)
+    legend_width = draw_legend(canvas, parse_list(params, 'chdl'), colors)
+    area = PlotArea(canvas, axes, legend_width)
+    draw_axes(canvas, area, axes)
+
+    groups = max([len(values) for values in series] or [0])
+    if not groups:
+        return
+
+    length = horizontal and area.height or area.width
+    extent = horizontal and area.width or area.height
+    slot = length / float(groups)
+    if stacked:
+        bar = slot * 0.6
+    else:
+        bar = slot * 0.8 / len(series)
+
+    for group in range(groups):
+        offset = group * slot + slot * (stacked and 0.2 or 0.1)
+        base = 0.0
+        for index, values in enumerate(series):
+            if group >= len(values):
+                continue
+
+            size = scale(values[group], extent)
+            if stacked:
+                position, start = offset, base
+                base += size
+            else:
+                position, start = offset + index * bar, 0.0
+
+            if horizontal:
+                canvas.rect(area.left + start, area.top + position,
+                            size, bar, colors[index])
+            else:
+                canvas.rect(area.left + position,
+                            area.bottom - start - size,
+                            bar, size, colors[index])
@@ -24,7 +24,8 @@ from sphinx.util.docstrings import prepare_docstring
 from sphinx.pycode import ModuleAnalyzer
 
 from sphinxcontrib import httpdomain
-from sphinxcontrib.autohttp.common import http_directive, import_object
+from sphinxcontrib.autohttp.common import (http_directive, build_cached,
+                                           import_app)
 
 
 def translate_bottle_rule(app, rule):
@@ -56,6 +57,16 @@ def get_routes(app):
         yield route.method, path, route
 
 
+def get_route_table(app):
+    """Inspects all routes of *app* for :class:`AutobottleDirective`.
+
+    :returns: list of ``(method, path, endpoint, view)`` tuples
+    """
+    return [(method, path, target.name or target.callback.__name__,
+             target.callback)
+            for method, path, target in get_routes(app)]
+
+
 class AutobottleDirective(Directive):
 
     has_content = True
@@ -79,21 +90,22 @@ class AutobottleDirective(Directive):
         return frozenset(re.split(r'\s*,\s*', undoc_endpoints))
 
     def make_rst(self):
-        app = import_object(self.arguments[0])
-        for method, path, target in get_routes(app):
-            endpoint = target.name or target.callback.__name__
+        env = self.state.document.settings.env
+        app = import_app(env, self.arguments[0])
+        table = build_cached(env, ('bottle', app), get_route_table, app)
+        for method, path, endpoint, view in table:
             if self.endpoints and endpoint not in self.endpoints:
                 continue
             if endpoint in self.undoc_endpoints:
                 continue
-            view = target.callback
             docstring = view.__doc__ or ''
             if not isinstance(docstring, six.text_type):
                 analyzer = ModuleAnalyzer.for_module(view.__module__)
                 docstring = force_decode(docstring, analyzer.encoding)
             if not docstring and 'include-empty-docstring' not in self.options:
                 continue
-            docstring = prepare_docstring(docstring)
+            docstring = build_cached(env, ('docstring', docstring),
+                                     prepare_docstring, docstring)
             for line in http_directive(method, path, docstring):
                 yield line
 
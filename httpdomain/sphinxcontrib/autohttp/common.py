@@ -22,6 +22,29 @@ def import_object(import_name):
     return eval(expr, globals, mod.__dict__)
 
 
+def build_cached(env, key, function, *args):
+    """Returns ``function(*args)``, calling it only once per build for *key*.
+
+    Directives documenting the same application use it to share the imported
+    application and its inspected routes.
+    """
+    app = getattr(env, 'app', None)
+    if app is None:
+        return function(*args)
+    try:
+        cache = app.builder._autohttp_cache
+    except AttributeError:
+        cache = app.builder._autohttp_cache = {}
+    if key not in cache:
+        cache[key] = function(*args)
+    return cache[key]
+
+
+def import_app(env, import_name):
+    """Imports the application *import_name* once per build."""
+    return build_cached(env, ('app', import_name), import_object, import_name)
+
+
 def http_directive(method, path, content):
     method = method.lower().strip()
     if isinstance(content, six.string_types):
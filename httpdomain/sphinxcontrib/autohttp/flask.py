@@ -28,7 +28,7 @@ from sphinx.pycode import ModuleAnalyzer
 from sphinxcontrib import httpdomain
 from sphinxcontrib.autohttp.common import http_directive, import_object
 
-from .flask_base import AutoflaskBase
+from .flask_base import AutoflaskBase, setup_rst_cache
 
 class AutoflaskDirective(AutoflaskBase):
 
@@ -45,3 +45,4 @@ class AutoflaskDirective(AutoflaskBase):
 def setup(app):
     app.setup_extension('sphinxcontrib.httpdomain')
     app.add_directive('autoflask', AutoflaskDirective)
+    setup_rst_cache(app)
@@ -11,8 +11,10 @@
 """
 
 import re
-import itertools
+import sys
 import six
+import hashlib
+import inspect
 import collections
 
 from docutils.parsers.rst import directives
@@ -22,10 +24,19 @@ from sphinx.util.compat import Directive
 from sphinx.util.docstrings import prepare_docstring
 from sphinx.pycode import ModuleAnalyzer
 
-from sphinxcontrib.autohttp.common import http_directive, import_object
+from sphinxcontrib.autohttp.common import (http_directive, build_cached,
+                                           import_app)
+
+
+#: Results of :func:`translate_werkzeug_rule` by rule string.
+_translated_rules = {}
 
 
 def translate_werkzeug_rule(rule):
+    try:
+        return _translated_rules[rule]
+    except KeyError:
+        pass
     from werkzeug.routing import parse_rule
     buf = six.StringIO()
     for conv, arg, var in parse_rule(rule):
@@ -38,24 +49,24 @@ def translate_werkzeug_rule(rule):
             buf.write(')')
         else:
             buf.write(var)
-    return buf.getvalue()
+    _translated_rules[rule] = buf.getvalue()
+    return _translated_rules[rule]
 
 
 def get_routes(app, endpoint=None, order=None):
-    endpoints = []
+    # endpoints in the order they are first matched, each with its rules in
+    # the order of url_map.iter_rules(endpoint)
+    endpoints = collections.OrderedDict()
     for rule in app.url_map.iter_rules(endpoint):
-        url_with_endpoint = (
-            six.text_type(next(app.url_map.iter_rules(rule.endpoint))),
-            rule.endpoint
-        )
-        if url_with_endpoint not in endpoints:
-            endpoints.append(url_with_endpoint)
+        if rule.endpoint not in endpoints:
+            endpoints[rule.endpoint] = list(
+                app.url_map.iter_rules(rule.endpoint))
+    endpoints = list(endpoints.items())
     if order == 'path':
-        endpoints.sort()
-    endpoints = [e for _, e in endpoints]
-    for endpoint in endpoints:
+        endpoints.sort(key=lambda item: (six.text_type(item[1][0]), item[0]))
+    for endpoint, rules in endpoints:
         methodrules = {}
-        for rule in app.url_map.iter_rules(endpoint):
+        for rule in rules:
             methods = cleanup_methods(rule.methods)
             path = translate_werkzeug_rule(rule.rule)
             for method in methods:
@@ -67,11 +78,100 @@ def get_routes(app, endpoint=None, order=None):
             yield method, paths, endpoint
 
 
+def get_route_table(app, order=None):
+    """Inspects all routes of *app* for :meth:`AutoflaskBase.inspect_routes`.
+
+    :returns: ordered dict from endpoint to the list of its routes, as
+              ``(method, paths, view, view_func, view_doc)`` tuples
+    """
+    table = collections.OrderedDict()
+    for method, paths, endpoint in get_routes(app, order=order):
+        view = app.view_functions.get(endpoint)
+        view_class = getattr(view, 'view_class', None)
+        if view_class is None:
+            view_func = view
+        else:
+            view_func = getattr(view_class, method.lower(), None)
+
+        view_doc = getattr(view, '__doc__', None) or ''
+        if view_func and view_func.__doc__:
+            view_doc = view_func.__doc__
+
+        table.setdefault(endpoint, []).append(
+            (method, paths, view, view_func, view_doc))
+    return table
+
+
+def module_source(module_name):
+    """Returns the source file of the imported module *module_name*."""
+    try:
+        return inspect.getsourcefile(sys.modules[module_name])
+    except (KeyError, TypeError):
+        return None
+
+
+def app_modules(import_name, app):
+    """Returns the names of the modules building *app*: the module it is
+    imported from, the modules of the application, of its blueprints and of
+    its views, and the packages containing them."""
+    names = set([import_name, app.import_name])
+    names.update(blueprint.import_name
+                 for blueprint in app.blueprints.values())
+    names.update(getattr(view, '__module__', None)
+                 for view in app.view_functions.values())
+    modules = set()
+    for name in names:
+        if not name:
+            continue
+        parts = name.split('.')
+        modules.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+    return modules
+
+
+def route_key(qref, method, paths, view_func, view_doc):
+    """Identifies the reST of a route by its view's qualified name, the hash
+    of its docstring and its rules."""
+    if view_func is None:
+        view_name = None
+    else:
+        view_name = '%s.%s' % (
+            getattr(view_func, '__module__', None),
+            getattr(view_func, '__qualname__',
+                    getattr(view_func, '__name__', None)))
+    if isinstance(view_doc, six.text_type):
+        view_doc = view_doc.encode('utf-8')
+    return (qref, method, tuple(paths), view_name,
+            hashlib.sha1(view_doc).hexdigest())
+
+
+def purge_rst(app, env, docname):
+    if hasattr(env, 'autoflask_rst_keys'):
+        env.autoflask_rst_keys.pop(docname, None)
+
+
+def prune_rst(app, env):
+    """Forgets the reST of directives which no document uses anymore."""
+    if hasattr(env, 'autoflask_rst'):
+        used = set()
+        for keys in env.autoflask_rst_keys.values():
+            used.update(keys)
+        for key in list(env.autoflask_rst):
+            if key not in used:
+                del env.autoflask_rst[key]
+
+
+def setup_rst_cache(app):
+    app.connect('env-purge-doc', purge_rst)
+    app.connect('env-updated', prune_rst)
+
+
+AUTOADDED_METHODS = frozenset(['OPTIONS', 'HEAD'])
+
+
 def cleanup_methods(methods):
-    autoadded_methods = frozenset(['OPTIONS', 'HEAD'])
-    if methods <= autoadded_methods:
+    if methods <= AUTOADDED_METHODS:
         return methods
-    return methods.difference(autoadded_methods)
+    return methods.difference(AUTOADDED_METHODS)
 
 
 def quickref_directive(method, path, content):
@@ -174,19 +274,29 @@ class AutoflaskBase(Directive):
             return frozenset()
         return frozenset(re.split(r'\s*,\s*', groupby))
 
+    @property
+    def env(self):
+        return self.state.document.settings.env
+
     def inspect_routes(self, app):
         """Inspects the views of Flask.
 
+        The routes of an application are only inspected once per build, and
+        filtered for every directive.
+
         :param app: The Flask application.
         :returns: 4-tuple like ``(method, paths, view_func, view_doc)``
         """
+        table = build_cached(self.env, ('flask', app, self.order),
+                             get_route_table, app, self.order)
         if self.endpoints:
-            routes = itertools.chain(*[get_routes(app, endpoint, self.order)
-                                       for endpoint in self.endpoints])
+            endpoints = self.endpoints
         else:
-            routes = get_routes(app, order=self.order)
+            endpoints = table
+        routes = ((endpoint, route)
+                  for endpoint in endpoints for route in table[endpoint])
 
-        for method, paths, endpoint in routes:
+        for endpoint, (method, paths, view, view_func, view_doc) in routes:
             try:
                 blueprint, _, endpoint_internal = endpoint.rpartition('.')
                 if self.blueprints and blueprint not in self.blueprints:
@@ -206,7 +316,8 @@ class AutoflaskBase(Directive):
             if ('undoc-static' in self.options and endpoint == 'static' and
                     static_url_path + '/(path:filename)' in paths):
                 continue
-            view = app.view_functions[endpoint]
+            if view is None:
+                view = app.view_functions[endpoint]  # KeyError as it was
 
             if self.modules and view.__module__ not in self.modules:
                 continue
@@ -214,16 +325,6 @@ class AutoflaskBase(Directive):
             if self.undoc_modules and view.__module__ in self.modules:
                 continue
 
-            view_class = getattr(view, 'view_class', None)
-            if view_class is None:
-                view_func = view
-            else:
-                view_func = getattr(view_class, method.lower(), None)
-
-            view_doc = view.__doc__ or ''
-            if view_func and view_func.__doc__:
-                view_doc = view_func.__doc__
-
             if not isinstance(view_doc, six.text_type):
                 analyzer = ModuleAnalyzer.for_module(view.__module__)
                 view_doc = force_decode(view_doc, analyzer.encoding)
@@ -242,16 +343,50 @@ class AutoflaskBase(Directive):
             yield (method, paths, view_func, view_doc)
 
     def make_rst(self, qref=False):
-        app = import_object(self.arguments[0])
+        """Returns the lines of reST, or the quick reference rows if *qref*.
+
+        The reST of every route is kept in the environment by
+        :func:`route_key` and reused in later builds while the inspected
+        route is the same.  The modules building the application, see
+        :func:`app_modules`, become dependencies of the document, so it is
+        read again when they change.
+        """
+        env = self.env
+        if not hasattr(env, 'autoflask_rst'):
+            env.autoflask_rst = {}  # key: lines
+            env.autoflask_rst_keys = {}  # docname: set of keys
+        keys = env.autoflask_rst_keys.setdefault(env.docname, set())
+
+        app = import_app(env, self.arguments[0])
+        modules = app_modules(self.arguments[0].split(':', 1)[0], app)
         routes = self.inspect_routes(app)
         if 'view' in self.groupby:
             routes = self.groupby_view(routes)
+        result = []
         for method, paths, view_func, view_doc in routes:
-            docstring = prepare_docstring(view_doc)
-            if qref:
-                for path in paths:
-                    row = quickref_directive(method, path, docstring)
-                    yield row
-            else:
-                for line in http_directive(method, paths, docstring):
-                    yield line
+            key = route_key(qref, method, paths, view_func, view_doc)
+            keys.add(key)
+            lines = env.autoflask_rst.get(key)
+            if lines is None:
+                lines = env.autoflask_rst[key] = list(
+                    self.generate_rst(qref, method, paths, view_doc))
+            result.extend(lines)
+
+        for module in modules:
+            filename = module_source(module)
+            if filename:
+                env.note_dependency(filename)
+        return result
+
+    def generate_rst(self, qref, method, paths, view_doc):
+        """Generates the lines of reST, or the quick reference rows if
+        *qref*, of a route."""
+        docstring = build_cached(self.env, ('docstring', view_doc),
+                                 prepare_docstring, view_doc)
+        if qref:
+            for path in paths:
+                row = quickref_directive(method, path, docstring)
+                yield row
+        else:
+            for line in http_directive(method, paths, docstring):
+                yield line
@@ -18,6 +18,7 @@ from sphinxcontrib import httpdomain
 from sphinx.util.nodes import nested_parse_with_titles
 
 from .flask import AutoflaskBase
+from .flask_base import setup_rst_cache
 
 
 class QuickReferenceFlaskDirective(AutoflaskBase):
@@ -76,3 +77,4 @@ class QuickReferenceFlaskDirective(AutoflaskBase):
 def setup(app):
     app.setup_extension('sphinxcontrib.httpdomain')
     app.add_directive('qrefflask', QuickReferenceFlaskDirective)
+    setup_rst_cache(app)
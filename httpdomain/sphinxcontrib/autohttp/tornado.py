@@ -25,7 +25,8 @@ from sphinx.util.docstrings import prepare_docstring
 from sphinx.pycode import ModuleAnalyzer
 
 from sphinxcontrib import httpdomain
-from sphinxcontrib.autohttp.common import http_directive, import_object
+from sphinxcontrib.autohttp.common import (http_directive, build_cached,
+                                           import_app)
 
 
 def translate_tornado_rule(app, rule):
@@ -68,6 +69,21 @@ def normalize_path(path):
     return path
 
 
+def get_route_table(app):
+    """Inspects all routes of *app* for :class:`AutoTornadoDirective`.
+
+    :returns: list of ``(method, path, endpoint, docstring)`` tuples
+    """
+    table = []
+    for method, path, handler in get_routes(app):
+        class_name = handler.__name__
+        method_name = getattr(handler, method).__name__
+        endpoint = '.'.join((class_name, method_name))
+        docstring = getattr(handler, method).__doc__ or ''
+        table.append((method, normalize_path(path), endpoint, docstring))
+    return table
+
+
 class AutoTornadoDirective(Directive):
 
     has_content = True
@@ -91,25 +107,23 @@ class AutoTornadoDirective(Directive):
         return frozenset(re.split(r'\s*,\s*', undoc_endpoints))
 
     def make_rst(self):
-        app = import_object(self.arguments[0])
-        for method, path, handler in get_routes(app):
-            class_name = handler.__name__
-            method_name = getattr(handler, method).__name__
-            endpoint = '.'.join((class_name, method_name))
-
+        env = self.state.document.settings.env
+        app = import_app(env, self.arguments[0])
+        table = build_cached(env, ('tornado', app), get_route_table, app)
+        for method, path, endpoint, docstring in table:
             if self.endpoints and endpoint not in self.endpoints:
                 continue
             if endpoint in self.undoc_endpoints:
                 continue
 
-            docstring = getattr(handler, method).__doc__ or ''
             #if not isinstance(docstring, unicode):
             #    analyzer = ModuleAnalyzer.for_module(view.__module__)
             #    docstring = force_decode(docstring, analyzer.encoding)
             if not docstring and 'include-empty-docstring' not in self.options:
                 continue
-            docstring = prepare_docstring(docstring)
-            for line in http_directive(method, normalize_path(path), docstring):
+            docstring = build_cached(env, ('docstring', docstring),
+                                     prepare_docstring, docstring)
+            for line in http_directive(method, path, docstring):
                 yield line
 
     def run(self):
@@ -10,6 +10,7 @@
 """
 
 import re
+import bisect
 
 from docutils import nodes
 
@@ -25,17 +26,6 @@ from sphinx.directives import ObjectDescription, directives
 from sphinx.util.nodes import make_refnode
 from sphinx.util.docfields import GroupedField, TypedField
 
-# The env.get_doctree() lookup results in a pickle.load() call which is
-# expensive enough to dominate the runtime entirely when the number of endpoints
-# and references is large enough. The doctrees are generated during the read-
-# phase and we can cache their lookup during the write-phase significantly
-# improving performance.
-# Currently sphinxcontrib-httpdomain does not declare to support parallel read
-# support (parallel_read_safe is the default False) so we can simply use a
-# module global to hold the cache.
-_doctree_cache = {}
-
-
 class DocRef(object):
     """Represents a reference to an abstract specification."""
 
@@ -238,17 +228,53 @@ http_sig_param_re = re.compile(r'\((?:(?P<type>[^:)]+):)?(?P<name>[\w_]+)\)',
                                re.VERBOSE)
 
 
+METHOD_ORDER = ['HEAD', 'GET', 'POST', 'PUT', 'DELETE', 'PATCH',
+                'OPTIONS', 'TRACE', 'CONNECT', 'COPY', 'ANY']
+
+
+def method_rank(method):
+    method = method.upper()
+    if method in METHOD_ORDER:
+        return METHOD_ORDER.index(method)
+    return 100
+
+
 def sort_by_method(entries):
     def cmp(item):
-        order = ['HEAD', 'GET', 'POST', 'PUT', 'DELETE', 'PATCH',
-                 'OPTIONS', 'TRACE', 'CONNECT', 'COPY', 'ANY']
-        method = item[0].split(' ', 1)[0]
-        if method in order:
-            return order.index(method)
-        return 100
+        return method_rank(item[0].split(' ', 1)[0])
     return sorted(entries, key=cmp)
 
 
+def prefix_trie(prefixes):
+    """Return the path segments of ``prefixes`` as nested dicts, where
+    ``None`` marks the end of a prefix.
+    """
+    trie = {}
+    for prefix in prefixes:
+        node = trie
+        for segment in prefix.split('/'):
+            if segment:
+                node = node.setdefault(segment, {})
+        node[None] = True
+    return trie
+
+
+def grouping_prefix(path, trie):
+    """Return the group of ``path`` in the routing table: its first segment
+    after the longest prefix in ``trie`` that it starts with.
+    """
+    letters = [x for x in path.split('/') if x]
+    node = trie
+    depth = 0
+    for i, segment in enumerate(letters):
+        node = node.get(segment)
+        if node is None:
+            break
+        if None in node:
+            depth = i + 1
+    return '/' + '/'.join(letters[:depth + 1])
+
+
 def http_resource_anchor(method, path):
     path = re.sub(r'[{}]', '', re.sub(r'[<>:/]', '-', path))
     return method.lower() + '-' + path
@@ -335,10 +361,10 @@ class HTTPResource(ObjectDescription):
     def add_target_and_index(self, name_cls, sig, signode):
         signode['ids'].append(http_resource_anchor(*name_cls[1:]))
         if 'noindex' not in self.options:
-            self.env.domaindata['http'][self.method][sig] = (
+            self.env.domains['http'].note_route(self.method, sig, (
                 self.env.docname,
                 self.options.get('synopsis', ''),
-                'deprecated' in self.options)
+                'deprecated' in self.options))
 
     def get_index_text(self, modname, name):
         return ''
@@ -517,6 +543,22 @@ class HTTPXRefHeaderRole(XRefRole):
         return [node], []
 
 
+class EnvDocument(object):
+    """Stands in for the doctree of *docname* when a role reports problems
+    while its references are resolved, so that the doctree does not have to
+    be loaded just for its reporter."""
+
+    def __init__(self, env, docname):
+        self.reporter = self
+        self.env = env
+        self.docname = docname
+
+    def warning(self, message, line=None):
+        self.env.warn(self.docname, message, line)
+
+    error = warning
+
+
 class HTTPIndex(Index):
 
     name = 'routingtable'
@@ -526,11 +568,6 @@ class HTTPIndex(Index):
     def __init__(self, *args, **kwargs):
         super(HTTPIndex, self).__init__(*args, **kwargs)
 
-        self.ignore = [
-            [l for l in x.split('/') if l]
-            for x in self.domain.env.config['http_index_ignore_prefixes']]
-        self.ignore.sort(reverse=True)
-
         # During HTML generation these values pick from class,
         # not from instance so we have a little hack the system
         cls = self.__class__
@@ -538,29 +575,21 @@ class HTTPIndex(Index):
         cls.localname = self.domain.env.config['http_index_localname']
 
     def grouping_prefix(self, path):
-        letters = [x for x in path.split('/') if x]
-        for prefix in self.ignore:
-            if letters[:len(prefix)] == prefix:
-                return '/' + '/'.join(letters[:len(prefix) + 1])
-        return '/%s' % (letters[0] if letters else '',)
+        return grouping_prefix(path, self.domain.index_trie())
 
     def generate(self, docnames=None):
-        content = {}
-        items = ((method, path, info)
-                 for method, routes in self.domain.routes.items()
-                 for path, info in routes.items())
-        items = sorted(items, key=lambda item: item[1])
-        for method, path, info in items:
-            entries = content.setdefault(self.grouping_prefix(path), [])
-            entries.append([
-                method.upper() + ' ' + path, 0, info[0],
-                http_resource_anchor(method, path),
-                '', 'Deprecated' if info[2] else '', info[1]
-            ])
-        items = sorted(
-            (path, sort_by_method(entries))
-            for path, entries in content.items()
-        )
+        index = self.domain.route_index()
+        items = []
+        for prefix in sorted(index):
+            entries = []
+            for _, path, method in index[prefix]:
+                info = self.domain.data[method][path]
+                entries.append([
+                    method.upper() + ' ' + path, 0, info[0],
+                    http_resource_anchor(method, path),
+                    '', 'Deprecated' if info[2] else '', info[1]
+                ])
+            items.append((prefix, entries))
         return (items, True)
 
 
@@ -626,20 +655,87 @@ class HTTPDomain(Domain):
         'trace': {},
         'connect': {},
         'copy': {},
-        'any': {}
+        'any': {},
+        'docs': {},  # docname: set of (method, path)
+        'index': {},  # grouping prefix: sorted list of (rank, path, method)
+        'index_prefixes': None  # http_index_ignore_prefixes of the index
     }
 
+    data_version = 2
+
     indices = [HTTPIndex]
 
     @property
     def routes(self):
         return dict((key, self.data[key]) for key in self.object_types)
 
+    #: References whose targets do not depend on other documents, so that
+    #: they are resolved by their roles as soon as the document is read.
+    local_xref_types = ('statuscode', 'header', 'method')
+
+    def process_doc(self, env, docname, document):
+        # Doc fields such as ``:statuscode 404:`` make pending references
+        for node in document.traverse(addnodes.pending_xref):
+            if node.get('refdomain') != self.name or \
+               node.get('reftype') not in self.local_xref_types:
+                continue
+            role = self.roles[node['reftype']]
+            node.replace_self(role.result_nodes(document, env, node, None)[0])
+
+    def index_trie(self):
+        prefixes = self.env.config['http_index_ignore_prefixes']
+        if getattr(self, '_index_trie', (None,))[0] != prefixes:
+            self._index_trie = (list(prefixes), prefix_trie(prefixes))
+        return self._index_trie[1]
+
+    def route_index(self):
+        """Return the routes grouped by :func:`grouping_prefix`, sorted the
+        way the routing table lists them.  The groups are kept up to date as
+        routes are added and removed, and only computed again when
+        ``http_index_ignore_prefixes`` changes.
+        """
+        prefixes = list(self.env.config['http_index_ignore_prefixes'])
+        if self.data['index_prefixes'] != prefixes:
+            index = self.data['index'] = {}
+            self.data['index_prefixes'] = prefixes
+            trie = self.index_trie()
+            for method, routes in self.routes.items():
+                for path in routes:
+                    index.setdefault(grouping_prefix(path, trie), []).append(
+                        (method_rank(method), path, method))
+            for entries in index.values():
+                entries.sort()
+        return self.data['index']
+
+    def note_route(self, method, path, info):
+        routes = self.data[method]
+        if path not in routes:
+            entries = self.route_index().setdefault(
+                grouping_prefix(path, self.index_trie()), [])
+            bisect.insort(entries, (method_rank(method), path, method))
+        routes[path] = info
+        self.data['docs'].setdefault(info[0], set()).add((method, path))
+
     def clear_doc(self, docname):
-        for typ, routes in self.routes.items():
-            for path, info in list(routes.items()):
-                if info[0] == docname:
-                    del routes[path]
+        index = self.route_index()
+        trie = self.index_trie()
+        for method, path in self.data['docs'].pop(docname, ()):
+            routes = self.data[method]
+            # the route may have been documented again by another document
+            if path in routes and routes[path][0] == docname:
+                del routes[path]
+                prefix = grouping_prefix(path, trie)
+                index[prefix].remove((method_rank(method), path, method))
+                if not index[prefix]:
+                    del index[prefix]
+
+    def merge_domaindata(self, docnames, otherdata):
+        for docname in docnames:
+            for method, path in otherdata['docs'].get(docname, ()):
+                info = otherdata[method].get(path)
+                if info is None or info[0] != docname:
+                    continue
+                self.note_route(method, path, info)
 
     def resolve_xref(self, env, fromdocname, builder, typ, target,
                      node, contnode):
@@ -651,16 +747,14 @@ class HTTPDomain(Domain):
             if role is None:
                 return None
 
-            if fromdocname not in _doctree_cache:
-                _doctree_cache[fromdocname] = env.get_doctree(fromdocname)
-            doctree = _doctree_cache[fromdocname]
-
-            resnode = role.result_nodes(doctree, env, node, None)[0][0]
+            # References of local_xref_types only get here if they are made
+            # after the document is read, e.g. by doctree-read handlers
+            document = EnvDocument(env, fromdocname)
+            resnode = role.result_nodes(document, env, node, None)[0][0]
             if isinstance(resnode, addnodes.pending_xref):
                 text = node[0][0]
-                reporter = doctree.reporter
-                reporter.warning('Cannot resolve reference to %r' % text,
-                                 line=node.line)
+                document.reporter.warning(
+                    'Cannot resolve reference to %r' % text, line=node.line)
                 return None
             return resnode
         else:
@@ -767,3 +861,4 @@ def setup(app):
     app.add_config_value('http_index_localname', 'HTTP Routing Table', True)
     app.add_config_value('http_strict_mode', True, None)
     app.add_config_value('http_headers_ignore_prefixes', ['X-'], None)
+    return {'parallel_read_safe': True}
@@ -0,0 +1,46 @@
+"""Times sphinxcontrib.autohttp.flask_base.get_routes on a synthetic Flask
+application.
+
+Usage: python benchmark_autoflask.py [number of routes]
+
+The application has a blueprint for every 100 routes, and every view is
+routed twice (a collection and an item path) with several methods, like a
+large REST gateway.
+"""
+import sys
+import time
+
+from flask import Blueprint, Flask
+
+from sphinxcontrib.autohttp.flask_base import get_routes
+
+
+def create_app(routes):
+    app = Flask(__name__)
+    for start in range(0, routes, 200):
+        blueprint = Blueprint('bp%d' % start, __name__)
+        for number in range(start, min(start + 200, routes), 2):
+            def view(**kwargs):
+                """Resource view."""
+            blueprint.add_url_rule('/resource%d/' % number,
+                                   'view%d' % number, view,
+                                   methods=['GET', 'POST'])
+            blueprint.add_url_rule('/resource%d/<int:item_id>' % number,
+                                   'view%d' % number, view,
+                                   methods=['GET', 'PUT', 'DELETE'])
+        app.register_blueprint(blueprint, url_prefix='/bp%d' % start)
+    return app
+
+
+def main(routes):
+    app = create_app(routes)
+    for order in (None, 'path'):
+        start = time.time()
+        count = sum(1 for route in get_routes(app, order=order))
+        print('%d rules, order=%s: %d routes in %.2f s' %
+              (len(list(app.url_map.iter_rules())), order, count,
+               time.time() - start))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 12000)
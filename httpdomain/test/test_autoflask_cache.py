@@ -0,0 +1,120 @@
+"""Incremental builds of autoflask directives.
+
+Every build runs sphinx-build in a new process, as the application has to be
+imported again.  Usage: python -m unittest test_autoflask_cache
+"""
+import os
+import sys
+import time
+import functools
+import shutil
+import tempfile
+import textwrap
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONF = '''
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, %r)
+import sphinxcontrib
+sphinxcontrib.__path__.insert(0, %r)
+extensions = ['sphinxcontrib.autohttp.flask']
+master_doc = 'index'
+''' % (ROOT, os.path.join(ROOT, 'sphinxcontrib'))
+
+BUILD = ('import sys, sphinx; '
+         "sys.exit(sphinx.main(['sphinx-build', '-q', '-b', 'text'] + "
+         'sys.argv[1:]))')
+
+BLUEPRINT = '''
+from flask import Blueprint
+
+blueprint = Blueprint(%(name)r, __name__)
+
+
+@blueprint.route('/%(name)s')
+def view():
+    """%(doc)s"""
+'''
+
+PACKAGE = '''
+from flask import Flask
+
+
+def create_app():
+    app = Flask(__name__)
+    for name in %r:
+        module = __import__('pkg.' + name, fromlist=['blueprint'])
+        app.register_blueprint(module.blueprint)
+    return app
+'''
+
+
+class TestIncrementalBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tempdir, 'src')
+        os.makedirs(os.path.join(self.src, 'pkg'))
+        self.write('conf.py', CONF)
+        self.write('wsgi.py', 'from pkg import create_app\n'
+                              'app = create_app()\n')
+        self.write('index.rst', 'API\n===\n\n.. autoflask:: wsgi:app\n')
+        self.write('pkg/a.py', BLUEPRINT % {'name': 'a', 'doc': 'View A.'})
+        self.write('pkg/b.py', BLUEPRINT % {'name': 'b', 'doc': 'View B.'})
+        self.write('pkg/__init__.py', PACKAGE % (['a'],))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.src, filename), 'w') as f:
+            f.write(textwrap.dedent(content))
+
+    def build(self):
+        out = os.path.join(self.tempdir, 'out')
+        subprocess.check_call([sys.executable, '-B', '-c', BUILD,
+                               self.src, out])
+        with open(os.path.join(out, 'index.txt')) as f:
+            return f.read()
+
+    def modify(self, filename, content):
+        # the modification time has to differ from the previous build's
+        time.sleep(1)
+        self.write(filename, content)
+
+    def test_blueprint_added(self):
+        self.assertNotIn('GET /b', self.build())
+        self.modify('pkg/__init__.py', PACKAGE % (['a', 'b'],))
+        output = self.build()
+        self.assertIn('GET /a', output)
+        self.assertIn('GET /b', output)
+
+    def test_view_changed(self):
+        self.assertIn('View A.', self.build())
+        self.modify('pkg/a.py', BLUEPRINT % {'name': 'a', 'doc': 'New A.'})
+        output = self.build()
+        self.assertNotIn('View A.', output)
+        self.assertIn('New A.', output)
+
+    def test_unchanged(self):
+        output = self.build()
+        self.assertEqual(self.build(), output)
+
+
+class TestRouteKey(unittest.TestCase):
+
+    def test_partial_view(self):
+        import sphinxcontrib
+        sphinxcontrib.__path__.insert(0, os.path.join(ROOT, 'sphinxcontrib'))
+        from sphinxcontrib.autohttp.flask_base import route_key
+        view = functools.partial(lambda name: name, 'a')
+        key = route_key(False, 'GET', ['/a'], view, 'View A.')
+        self.assertEqual(key[:3], (False, 'GET', ('/a',)))
+
+
+if __name__ == '__main__':
+    unittest.main()
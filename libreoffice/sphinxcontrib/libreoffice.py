@@ -18,14 +18,26 @@ import sys
 import os
 import posixpath
 
+try:
+    from hashlib import sha1 as sha
+except ImportError:
+    from sha import sha
+
 from glob import glob
-from subprocess import call, PIPE
+from subprocess import call, Popen, PIPE
 
 import shutil
 import tempfile
+import threading
+import time
 
 from PIL import Image, ImageOps
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from docutils import nodes
 from docutils.parsers.rst.directives.images import Figure
 
@@ -34,6 +46,15 @@ from sphinx.util import ensuredir, relative_uri
 # Default output formats
 DEFAULT_FORMATS = dict(html='png', latex='pdf')
 
+# Export filter families of listener conversions by document service, the
+# filter is named like "draw_png_Export"
+EXPORT_FILTER_FAMILIES = [
+    ('com.sun.star.presentation.PresentationDocument', 'impress'),
+    ('com.sun.star.sheet.SpreadsheetDocument', 'calc'),
+    ('com.sun.star.text.TextDocument', 'writer'),
+    ('com.sun.star.drawing.DrawingDocument', 'draw'),
+]
+
 
 #-------------------------------------------------------------------------------
 # Utilities to find LibreOffice installation
@@ -78,6 +99,55 @@ def libreoffice_find():
 
 
 
+#-------------------------------------------------------------------------------
+# Render manifest
+#-------------------------------------------------------------------------------
+
+def _source_state(filename, previous=None):
+    """
+    Return the (mtime, size, digest) state of a source drawing. The digest is
+    only recomputed when mtime or size differ from the *previous* state.
+    """
+
+    st = os.stat(filename)
+    if previous and previous[:2] == (st.st_mtime, st.st_size):
+        return previous
+
+    f = open(filename, 'rb')
+    try:
+        digest = sha(f.read()).hexdigest()
+    finally:
+        f.close()
+
+    return (st.st_mtime, st.st_size, digest)
+
+
+def _manifest_lookup(env, out_fn_abs, inp_fn_abs, options_key):
+    """
+    Check the render manifest for an up to date output file.
+
+    Returns ``(entry, state)``: *entry* is the manifest entry if *out_fn_abs*
+    was rendered from the current source with the same options, else None;
+    *state* is the current state of the source drawing.
+    """
+
+    manifest = env.libreoffice_manifest
+    entry = manifest.get(out_fn_abs)
+    previous = entry and entry['source'] or None
+    state = _source_state(inp_fn_abs, previous)
+
+    if entry and 'size' in entry and entry['source'][2] == state[2] and \
+            entry['options'] == options_key and os.path.isfile(out_fn_abs):
+        if state is not previous:
+            # content is the same, remember the new mtime
+            entry['source'] = state
+        return entry, state
+
+    return None, state
+
+
+
+
 #-------------------------------------------------------------------------------
 # The LibreOffice Directive
 #-------------------------------------------------------------------------------
@@ -145,6 +215,7 @@ def libreoffice_render(app, doctree):
         
         # Setup paths
         inp_fn_abs = app.builder.env.relfn2path(drawing)[1]
+        app.builder.env.note_dependency(inp_fn_abs)
         inp_fn_base, _ = os.path.splitext(os.path.basename(drawing)) 
         out_fext = format_map[app.builder.format]        
         out_fn = '%s.%s' % (inp_fn_base, out_fext)
@@ -163,59 +234,375 @@ def libreoffice_render(app, doctree):
             out_fn_abs = os.path.join(out_dir, out_fn)
         
         ensuredir(out_dir)
-        
-        # Run LibreOffice
-        # A solution to run LibreOffice when another instance is already 
-        # running is to use a unique UserInstallation folder. More info at:
-        # https://www.libreoffice.org/bugzilla/show_bug.cgi?id=37531
-        
-        if os.name != 'nt':
-            tmp_folder = tempfile.mkdtemp()
-            tmp_path = 'file://' + tmp_folder
-        else:
-            tmp_path = '$SYSUSERCONFIG/tmp'
 
-        call([app.builder.config.libreoffice_binary, 
-                '--headless',
-                '-env:UserInstallation=' + tmp_path,
-                '--convert-to', out_fext,
-                '--outdir', out_dir,
-                inp_fn_abs], stdout=PIPE, stderr=PIPE)
+        options_key = (out_fext, bool(options.get('autocrop')))
+        entry, state = _manifest_lookup(app.builder.env, out_fn_abs,
+                                        inp_fn_abs, options_key)
+        if entry is None:
+            # converted in one go with all other drawings after reading
+            app.builder.env.libreoffice_pending[out_fn_abs] = dict(
+                input=inp_fn_abs, format=out_fext, outdir=out_dir,
+                options=options, options_key=options_key, source=state)
 
-        if os.name != 'nt':
-            shutil.rmtree(tmp_folder)
-        
-        # Crop white borders (images only)
-        if 'autocrop' in options and out_fext not in ('pdf', 'svg'):
-            if options['autocrop']:  
-                im = Image.open(out_fn_abs)
-                im.load()
-     
-                im_box = ImageOps.invert(im).getbbox()
-                im = im.crop(im_box)
+        figure.libreoffice.update(output=out_fn_abs, format=out_fext)
+
+        # Fill image information
+        for image in figure.traverse(nodes.image):
+            image['uri'] = out_fn_rel
 
-                im.save(out_fn_abs)
+
+def libreoffice_convert_pending(app, env):
+    """
+    Convert all drawings read in this build (env-updated callback)
+
+    Drawings are grouped by output format and directory, and each group is
+    converted by a single LibreOffice run.
+    """
+
+    pending = env.libreoffice_pending
+    if not pending:
+        return
+
+    listeners = _libreoffice_listeners(app)
+    if listeners:
+        converted = _libreoffice_convert_listeners(app, listeners, pending)
+    else:
+        converted = set()
+
+    # the drawings the listeners failed on are converted again by soffice
+    groups = {}
+    for out_fn_abs, job in pending.items():
+        if out_fn_abs not in converted:
+            groups.setdefault((job['format'], job['outdir']), []).append(job)
+
+    for (out_fext, out_dir), jobs in sorted(groups.items()):
+        _libreoffice_convert(app, [job['input'] for job in jobs],
+                             out_fext, out_dir)
+
+    for out_fn_abs, job in sorted(pending.items()):
+        if not os.path.isfile(out_fn_abs):
+            app.builder.warn('libreoffice: unable to convert %s' %
+                             job['input'])
+            continue
+
+        size = _libreoffice_autocrop(out_fn_abs, job['format'],
+                                     job['options'])
+        env.libreoffice_manifest[out_fn_abs] = dict(
+            source=job['source'], options=job['options_key'], size=size)
+
+    pending.clear()
+
+
+def _libreoffice_convert_listeners(app, listeners, pending):
+    """
+    Convert drawings in parallel, one at a time per listener, and return
+    the output filenames of those converted
+    """
+
+    jobs = sorted(pending.items())
+    converted = set()
+    lock = threading.Lock()
+
+    def worker(listener):
+        while True:
+            lock.acquire()
+            try:
+                if not jobs:
+                    return
+                out_fn_abs, job = jobs.pop()
+            finally:
+                lock.release()
+
+            try:
+                listener.convert(job['input'], out_fn_abs, job['format'])
+            except Exception, err:
+                app.builder.info('libreoffice: %s: %s, converting it again '
+                                 'with soffice' % (job['input'], err))
+            else:
+                converted.add(out_fn_abs)
+
+    threads = [threading.Thread(target=worker, args=(listener,))
+               for listener in listeners]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return converted
+
+
+def libreoffice_size(app, doctree, docname):
+    """
+    Set the size of rendered images (doctree-resolved callback)
+    """
+
+    for figure in doctree.traverse(nodes.figure):
+
+        if not hasattr(figure, 'libreoffice') or \
+                'output' not in figure.libreoffice:
+            continue
+
+        out_fn_abs = figure.libreoffice['output']
 
         # Get (w, h) - required to make :scale: work without indicating (w, h)
-        if out_fext not in ('pdf', 'svg'):
-            im = Image.open(out_fn_abs)
-            im.load()
-            (out_width, out_height) = im.size     
+        # The size is recorded when rendering, so images are never decoded
+        entry = app.builder.env.libreoffice_manifest.get(out_fn_abs)
+        if not entry or not entry.get('size'):
+            continue
+
+        (out_width, out_height) = entry['size']
 
-        # Fill image information
         for image in figure.traverse(nodes.image):
-            image['uri'] = out_fn_rel
+            image['width'] = str(out_width)
+            image['height'] = str(out_height)
+
+
+class _LibreOfficeListener(object):
+    """
+    A headless LibreOffice instance with its own profile, accepting
+    conversion requests through UNO on a local pipe
+    """
+
+    def __init__(self, binary, name):
+        self.name = name
+        self.profile = tempfile.mkdtemp()
+        self.desktop = None
+        self.devnull = open(os.devnull, 'w')
+        self.process = Popen([binary,
+                              '--headless', '--invisible', '--nologo',
+                              '--norestore', '--nodefault',
+                              '-env:UserInstallation=file://' + self.profile,
+                              '--accept=pipe,name=%s;urp;'
+                              'StarOffice.ComponentContext' % name],
+                             stdout=self.devnull, stderr=self.devnull)
+
+    def connect(self, timeout):
+        import uno
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local)
+
+        deadline = time.time() + timeout
+        while True:
             try:
-                image['width'] = str(out_width)
-                image['height'] = str(out_height)
-            except: pass
+                context = resolver.resolve('uno:pipe,name=%s;urp;'
+                                           'StarOffice.ComponentContext' %
+                                           self.name)
+                break
+            except Exception:
+                # not listening yet
+                if time.time() > deadline or self.process.poll() is not None:
+                    raise
+                time.sleep(0.25)
+
+        self.desktop = context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.frame.Desktop', context)
+
+    def convert(self, inp_fn_abs, out_fn_abs, out_fext):
+        import uno
+        from com.sun.star.beans import PropertyValue
+
+        def properties(**kwargs):
+            result = []
+            for name, value in kwargs.items():
+                prop = PropertyValue()
+                prop.Name, prop.Value = name, value
+                result.append(prop)
+            return tuple(result)
+
+        doc = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(inp_fn_abs), '_blank', 0,
+            properties(Hidden=True))
+        try:
+            family = 'draw'
+            for service, name in EXPORT_FILTER_FAMILIES:
+                if doc.supportsService(service):
+                    family = name
+                    break
+            filter_name = '%s_%s_Export' % (family, out_fext)
+            doc.storeToURL(uno.systemPathToFileUrl(out_fn_abs),
+                           properties(FilterName=filter_name))
+        finally:
+            doc.close(True)
+
+    def close(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                # the connection is lost when the office quits
+                pass
+
+        for i in range(40):
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.25)
+        else:
+            self.process.kill()
+            self.process.wait()
+
+        self.devnull.close()
+        shutil.rmtree(self.profile, ignore_errors=True)
+
+
+def _libreoffice_listeners(app):
+    """
+    Return the running listeners of the build, starting them on first use
+    """
+
+    count = app.builder.config.libreoffice_listener
+    if not count or os.name == 'nt':
+        return []
+
+    if hasattr(app.builder, '_libreoffice_listeners'):
+        return app.builder._libreoffice_listeners
+
+    listeners = app.builder._libreoffice_listeners = []
+
+    try:
+        import uno
+    except ImportError:
+        app.builder.warn('libreoffice: the uno module is required for '
+                         'libreoffice_listener, converting without it')
+        return listeners
+
+    # start all instances first, they initialise their profiles in parallel
+    started = [_LibreOfficeListener(app.builder.config.libreoffice_binary,
+                                    'sphinx-libreoffice-%d-%d' %
+                                    (os.getpid(), i))
+               for i in range(int(count))]
+
+    for listener in started:
+        try:
+            listener.connect(app.builder.config.libreoffice_listener_timeout)
+        except Exception, err:
+            app.builder.warn('libreoffice: unable to connect to listener: %s'
+                             % err)
+            listener.close()
+        else:
+            listeners.append(listener)
+
+    return listeners
+
+
+def _libreoffice_profile(app):
+    """
+    Return the UserInstallation URL used for the conversions of this build
+    """
+
+    # A solution to run LibreOffice when another instance is already 
+    # running is to use a unique UserInstallation folder. More info at:
+    # https://www.libreoffice.org/bugzilla/show_bug.cgi?id=37531
+    # Creating the profile is slow, so it is shared by all conversions of
+    # the build and removed in libreoffice_cleanup.
+
+    if os.name == 'nt':
+        return '$SYSUSERCONFIG/tmp'
+
+    if not hasattr(app.builder, '_libreoffice_profile'):
+        app.builder._libreoffice_profile = tempfile.mkdtemp()
+
+    return 'file://' + app.builder._libreoffice_profile
+
+
+def _libreoffice_convert(app, inp_fns_abs, out_fext, out_dir):
+    """
+    Convert drawings with a single headless LibreOffice run
+    """
+
+    call([app.builder.config.libreoffice_binary, 
+            '--headless',
+            '-env:UserInstallation=' + _libreoffice_profile(app),
+            '--convert-to', out_fext,
+            '--outdir', out_dir] + inp_fns_abs, stdout=PIPE, stderr=PIPE)
+
+
+def _libreoffice_autocrop(out_fn_abs, out_fext, options):
+    """
+    Crop white borders (images only) and return the image size, or None for
+    vector formats
+    """
+
+    if out_fext in ('pdf', 'svg'):
+        return None
+
+    im = Image.open(out_fn_abs)
+    if not options.get('autocrop'):
+        # only reads the header
+        return im.size
+
+    im.load()
+    im_box = _bounding_box(im)
+    if im_box and im_box != (0, 0) + im.size:
+        im = im.crop(im_box)
+        im.save(out_fn_abs)
+
+    return im.size
+
+
+def _bounding_box(im):
+    """
+    Return the bounding box of the non-white pixels of *im*
+    """
+
+    if im.mode not in ('L', 'RGB', 'RGBA'):
+        im = im.convert('RGB')
+
+    if numpy is None:
+        return ImageOps.invert(im.convert('RGB')).getbbox()
+
+    pixels = numpy.asarray(im)
+    if pixels.ndim == 3:
+        mask = (pixels[..., :3] != 255).any(axis=2)
+    else:
+        mask = pixels != 255
+
+    rows = numpy.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    cols = numpy.flatnonzero(mask.any(axis=0))
+
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+
+def libreoffice_init(app):
+    """
+    Make sure the environment has a render manifest (builder-inited callback)
+    """
+
+    if not hasattr(app.builder.env, 'libreoffice_manifest'):
+        app.builder.env.libreoffice_manifest = {}
+    app.builder.env.libreoffice_pending = {}
+
+
+def libreoffice_cleanup(app, exception):
+    """
+    Stop the listeners and remove the LibreOffice profiles of the build
+    (build-finished callback)
+    """
+
+    if hasattr(app.builder, '_libreoffice_profile'):
+        shutil.rmtree(app.builder._libreoffice_profile, ignore_errors=True)
+        del app.builder._libreoffice_profile
+
+    for listener in getattr(app.builder, '_libreoffice_listeners', []):
+        listener.close()
+    if hasattr(app.builder, '_libreoffice_listeners'):
+        del app.builder._libreoffice_listeners
 
 
 def setup(app):
     app.add_directive('libreoffice', LibreOfficeDirective)
 
+    app.connect('builder-inited', libreoffice_init)
     app.connect('doctree-read', libreoffice_render)
+    app.connect('env-updated', libreoffice_convert_pending)
+    app.connect('doctree-resolved', libreoffice_size)
+    app.connect('build-finished', libreoffice_cleanup)
     
     app.add_config_value('libreoffice_binary', libreoffice_find(), 'env')
     app.add_config_value('libreoffice_format', DEFAULT_FORMATS, 'env')
+    app.add_config_value('libreoffice_listener', 0, '')
+    app.add_config_value('libreoffice_listener_timeout', 60, '')
 
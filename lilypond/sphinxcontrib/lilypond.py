@@ -14,6 +14,7 @@
     Note: The extension has only very basic support for LaTeX builder.
 """
 
+import os
 import shutil
 import tempfile
 import posixpath
@@ -96,11 +97,37 @@ class LilyDirective(Directive):
         node['nowrap'] = 'nowrap' in self.options
         return [node]
 
+def trim_image(fn):
+    """
+    Crop the blank page margins off the bitmap *fn* in place.
+
+    Returns False when PIL is not available.
+    """
+    try:
+        from PIL import Image, ImageChops
+    except ImportError:
+        return False
+    im = Image.open(fn)
+    rgb = im.convert('RGB')
+    bg = Image.new('RGB', rgb.size, rgb.getpixel((0, 0)))
+    bbox = ImageChops.difference(rgb, bg).getbbox()
+    if bbox and bbox != (0, 0) + im.size:
+        im.crop(bbox).save(fn)
+    return True
+
 def render_lily(self, lily):
     """
     Render the Lilypond music expression *lily* using lilypond.
     """
-    shasum = "%s.png" % sha(lily.encode('utf-8')).hexdigest()
+    format = self.builder.config.pnglily_format
+    if format not in ('png', 'svg'):
+        raise LilyExtError(u'pnglily_format must be "png" or "svg", not %r'
+                           % format)
+    hashkey = lily.encode('utf-8')
+    if format == 'png':
+        # trimmed and untrimmed images must not be mistaken for each other
+        hashkey += str(bool(self.builder.config.pnglily_trim))
+    shasum = "%s.%s" % (sha(hashkey).hexdigest(), format)
     relfn = posixpath.join(self.builder.imgpath, 'lily', shasum)
     outfn = path.join(self.builder.outdir, '_images', 'lily', shasum)
     if path.isfile(outfn):
@@ -125,12 +152,25 @@ def render_lily(self, lily):
     tf.write(music)
     tf.close()
 
+    # lilypond names its output after the cropping mode in use; remove the
+    # results of the previous snippet so they are never picked up instead
+    candidates = [path.join(tempdir, 'music.%s.%s' % (suffix, format))
+                  for suffix in ('cropped', 'preview')]
+    candidates.append(path.join(tempdir, 'music.%s' % format))
+    for fn in candidates:
+        if path.isfile(fn):
+            os.remove(fn)
+
     ensuredir(path.dirname(outfn))
     # use some standard lilypond arguments
     lilypond_args = [self.builder.config.pnglily_lilypond]
-    #lilypond_args += ['-o', tempdir, '--png']
-    lilypond_args += ['-dbackend=eps', '-dno-gs-load-fonts', '-dinclude-eps-fonts',
-                      '-o', tempdir, '--png']
+    if format == 'svg':
+        # the SVG backend can crop to the music itself, which avoids
+        # shipping a full page for every snippet
+        lilypond_args += ['-dbackend=svg', '-dcrop', '-o', tempdir]
+    else:
+        lilypond_args += ['-dbackend=eps', '-dno-gs-load-fonts',
+                          '-dinclude-eps-fonts', '-o', tempdir, '--png']
     # add custom ones from config value
     lilypond_args.extend(self.builder.config.pnglily_lilypond_args)
 
@@ -151,8 +191,18 @@ def render_lily(self, lily):
         raise LilyExtError(u'lilypond exited with error:\n[stderr]\n%s\n'
                            '[stdout]\n%s' % (stderr.decode('utf-8'), stdout.decode('utf-8')))
 
-    shutil.copyfile(path.join(tempdir, 'music.png'), outfn)
-    #Popen(['mogrify', '-trim', outfn], stdout=PIPE, stderr=PIPE)
+    for fn in candidates:
+        if path.isfile(fn):
+            break
+    else:
+        raise LilyExtError(u'lilypond did not produce a %s file' % format)
+    shutil.copyfile(fn, outfn)
+    if format == 'png' and self.builder.config.pnglily_trim:
+        if not trim_image(outfn) and \
+                not hasattr(self.builder, '_lilypng_trim_warned'):
+            self.builder.warn('PIL is not installed, lilypond images will '
+                              'not be trimmed')
+            self.builder._lilypng_trim_warned = True
 
     return relfn
 
@@ -238,4 +288,6 @@ def setup(app):
     app.add_config_value('pnglily_fontsize', ['10', '-3'], False)
     app.add_config_value('pnglily_lilypond', 'lilypond', False)
     app.add_config_value('pnglily_lilypond_args', [], False)
+    app.add_config_value('pnglily_format', 'png', False)
+    app.add_config_value('pnglily_trim', True, False)
     app.connect('build-finished', cleanup_tempdir_lily)
@@ -1,7 +1,17 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import json
+import shutil
+import tempfile
+import threading
 import subprocess
+import multiprocessing
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
 
 try:
     from hashlib import sha1
@@ -62,39 +72,54 @@ class SadisplayDirective(Directive):
             raise SphinxWarning('sadisplay directive error - \
                     both defined :include: and :exclude:')
 
+        env = getattr(self.state.document.settings, 'env', None)
+        if env is not None:
+            if not hasattr(env, 'sadisplay_diagrams'):
+                env.sadisplay_diagrams = {}
+            env.sadisplay_diagrams.setdefault(env.docname, []).append(
+                dict((k, node[k]) for k in
+                     ('module', 'include', 'exclude', 'render')))
+
         return [node]
 
 
-def generate_name(self, content):
+def generate_name(builder, content):
     key = sha1(content.encode('utf-8')).hexdigest()
-    fname = 'sadisplay-%s.png' % key
-    imgpath = getattr(self.builder, 'imgpath', None)
-    if imgpath:
-        return ('/'.join((self.builder.imgpath, fname)),
-                os.path.join(self.builder.outdir, '_images', fname))
-    else:
-        return fname, os.path.join(self.builder.outdir, fname)
+    return image_paths(builder, 'sadisplay-%s.png' % key)
 
 
-def generate_plantuml_args(self):
-    if isinstance(self.builder.config.plantuml, str):
-        args = [self.builder.config.plantuml]
+def image_paths(builder, fname):
+    # imgpath is only set once the builder writes, so images rendered
+    # before that are placed according to the builder format
+    if builder.format == 'html':
+        return ('/'.join((getattr(builder, 'imgpath', ''), fname)),
+                os.path.join(builder.outdir, '_images', fname))
     else:
-        args = list(self.builder.config.plantuml)
+        return fname, os.path.join(builder.outdir, fname)
+
+
+def plantuml_command(builder):
+    if isinstance(builder.config.plantuml, str):
+        return [builder.config.plantuml]
+    return list(builder.config.plantuml)
+
+
+def generate_plantuml_args(builder):
+    args = plantuml_command(builder)
     args.extend('-pipe -charset utf-8'.split())
     return args
 
 
-def generate_graphviz_args(self):
-    if isinstance(self.builder.config.graphviz, str):
-        args = [self.builder.config.graphviz]
+def generate_graphviz_args(builder):
+    if isinstance(builder.config.graphviz, str):
+        args = [builder.config.graphviz]
     else:
-        args = list(self.builder.config.graphviz)
+        args = list(builder.config.graphviz)
     return args
 
 
-def render_image(self, content, command):
-    refname, outfname = generate_name(self, content)
+def render_image(builder, content, command):
+    refname, outfname = generate_name(builder, content)
     if os.path.exists(outfname):
         return refname  # don't regenerate
     ensuredir(os.path.dirname(outfname))
@@ -115,26 +140,75 @@ def render_image(self, content, command):
         f.close()
 
 
-def render(self, node):
+def module_names(builder, module_name):
+    """Return the attributes of module *module_name*
 
-    all_names = []
+    The result is cached on the builder, so that a module referenced by
+    several directives is only imported and walked once per build.
+    """
+    if not hasattr(builder, '_sadisplay_modules'):
+        builder._sadisplay_modules = {}
+    cache = builder._sadisplay_modules
+    if module_name in cache:
+        return cache[module_name]
 
-    for module_name in node['module']:
-        __import__(module_name, globals(), locals())
-        module = sys.modules[module_name]
+    __import__(module_name, globals(), locals())
+    module = sys.modules[module_name]
 
-        for attr in dir(module):
-            try:
-                m = getattr(module, attr)
+    names = []
+    for attr in dir(module):
+        try:
+            m = getattr(module, attr)
+
+            # !!!
+            # Ugly hack
+            repr(m) # without this statement - exception raises
+            # any ideas?
+
+            names.append(m)
+        except:
+            pass
+
+    cache[module_name] = names
+    return names
+
+
+def description_key(modules, desc, render, command):
+    """Hash the stable parts of a diagram: the module names, the names of
+    the tables, columns, properties and methods and the render options"""
+    objects, relations, inherits = desc
+    stable = [
+        modules,
+        [dict(name=obj['name'],
+              cols=obj.get('cols', []),
+              props=obj.get('props', []),
+              methods=obj.get('methods', []),
+              indexes=[(index['name'], index['cols'])
+                       for index in obj.get('indexes', [])])
+         for obj in objects],
+        [(rel['from'], rel['by'], rel['to']) for rel in relations],
+        [(inherit['child'], inherit['parent']) for inherit in inherits],
+        render,
+        command,
+    ]
+    try:
+        data = json.dumps(stable, sort_keys=True)
+    except (TypeError, ValueError) as err:
+        raise RendererError('sadisplay: cannot hash the description of %s: '
+                            '%s' % (', '.join(modules), err))
+    return sha1(data.encode('utf-8')).hexdigest()
 
-                # !!!
-                # Ugly hack
-                repr(m) # without this statement - exception raises
-                # any ideas?
 
-                all_names.append(m)
-            except:
-                pass
+def prepare(builder, node):
+    """Describe the models selected by *node*
+
+    Returns ``(key, render, content, command)``. *content* is None when an
+    image of the same description has already been rendered.
+    """
+    all_names = []
+
+    for module_name in node['module']:
+        all_names.extend(module_names(builder, module_name))
 
     names = []
 
@@ -159,16 +233,160 @@ def render(self, node):
 
     desc = sadisplay.describe(names)
 
-    render = node['render'] or self.builder.config.sadisplay_default_render
+    render = node['render'] or builder.config.sadisplay_default_render
+
+    if render == 'plantuml':
+        command = generate_plantuml_args(builder)
+    elif render == 'graphviz':
+        command = generate_graphviz_args(builder)
+
+    # the image is named after the rendered content; remember it by the
+    # hash of the description, so that unchanged models are not rendered
+    # again
+    env = builder.env
+    if not hasattr(env, 'sadisplay_images'):
+        env.sadisplay_images = {}
+    key = description_key(node['module'], desc, render, command)
+    fname = env.sadisplay_images.get(key)
+    if fname and os.path.exists(image_paths(builder, fname)[1]):
+        return key, render, None, command
 
     if render == 'plantuml':
         content = sadisplay.plantuml(desc)
-        command = generate_plantuml_args(self)
     elif render == 'graphviz':
         content = sadisplay.dot(desc)
-        command = generate_graphviz_args(self)
 
-    return render_image(self, content, command)
+    return key, render, content, command
+
+
+def remember_image(builder, key, content):
+    outfname = generate_name(builder, content)[1]
+    builder.env.sadisplay_images[key] = os.path.basename(outfname)
+
+
+def render(self, node):
+    key, _, content, command = prepare(self.builder, node)
+    if content is None:
+        fname = self.builder.env.sadisplay_images[key]
+        return image_paths(self.builder, fname)[0]
+
+    refname = render_image(self.builder, content, command)
+    remember_image(self.builder, key, content)
+    return refname
+
+
+def render_plantuml_batch(builder, diagrams):
+    """Render many plantuml *diagrams* with a single plantuml run
+
+    *diagrams* is a list of ``(key, content)``. Images of a failed run are
+    left to be rendered one by one by the visitors.
+    """
+    tempdir = tempfile.mkdtemp()
+    try:
+        files = []
+        for key, content in diagrams:
+            outfname = generate_name(builder, content)[1]
+            name = os.path.splitext(os.path.basename(outfname))[0]
+            fname = os.path.join(tempdir, name + '.txt')
+            with open(fname, 'wb') as f:
+                f.write(content.encode('utf-8'))
+            files.append(fname)
+
+        outdir = os.path.join(tempdir, 'out')
+        command = plantuml_command(builder)
+        command.extend(['-charset', 'utf-8', '-o', outdir])
+        command.extend(files)
+        try:
+            p = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        except OSError as err:
+            if err.errno != ENOENT:
+                raise
+            return
+        p.communicate()
+        if p.returncode != 0:
+            return
+
+        for key, content in diagrams:
+            outfname = generate_name(builder, content)[1]
+            result = os.path.join(outdir, os.path.basename(outfname))
+            if os.path.exists(result):
+                ensuredir(os.path.dirname(outfname))
+                shutil.move(result, outfname)
+                remember_image(builder, key, content)
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def render_pending(app, env):
+    """Render all diagrams of the build before writing starts
+
+    plantuml diagrams are rendered in batches by one plantuml process each,
+    graphviz ones by separate ``dot`` processes. At most
+    ``sadisplay_jobs`` renderers run at the same time.
+    """
+    builder = app.builder
+    if builder.format not in ('html', 'latex'):
+        return
+
+    plantuml = {}
+    graphviz = {}
+    for diagrams in getattr(env, 'sadisplay_diagrams', {}).values():
+        for node in diagrams:
+            try:
+                key, render, content, command = prepare(builder, node)
+            except Exception:
+                continue  # reported by the visitor
+            if content is None:
+                continue
+            if render == 'plantuml':
+                plantuml[key] = content
+            elif render == 'graphviz':
+                graphviz[key] = (content, command)
+
+    tasks = queue.Queue()
+    items = list(plantuml.items())
+    size = builder.config.sadisplay_plantuml_batch
+    for i in range(0, len(items), size):
+        tasks.put((render_plantuml_batch, (builder, items[i:i + size])))
+    for key, (content, command) in graphviz.items():
+        tasks.put((render_graphviz, (builder, key, content, command)))
+    if tasks.empty():
+        return
+
+    def worker():
+        while True:
+            try:
+                func, args = tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception:
+                pass  # reported by the visitor
+
+    jobs = builder.config.sadisplay_jobs or multiprocessing.cpu_count()
+    threads = [threading.Thread(target=worker)
+               for i in range(min(jobs, tasks.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def render_graphviz(builder, key, content, command):
+    try:
+        render_image(builder, content, command)
+    except RendererError:
+        # do not leave a broken image behind, the visitor retries
+        os.remove(generate_name(builder, content)[1])
+        raise
+    remember_image(builder, key, content)
+
+
+def purge_diagrams(app, env, docname):
+    if hasattr(env, 'sadisplay_diagrams'):
+        env.sadisplay_diagrams.pop(docname, None)
 
 
 def html_visit(self, node):
@@ -214,8 +432,12 @@ def setup(app):
         pass
 
     app.add_config_value('sadisplay_default_render', 'graphviz', False)
+    app.add_config_value('sadisplay_jobs', None, False)
+    app.add_config_value('sadisplay_plantuml_batch', 50, False)
 
     app.add_node(SaNode,
                  html=(html_visit, None),
                  latex=(latex_visit, None))
     app.add_directive('sadisplay', SadisplayDirective)
+    app.connect('env-purge-doc', purge_diagrams)
+    app.connect('env-updated', render_pending)
@@ -1,5 +1,21 @@
 #!/usr/bin/env python
+import os
 import sys
+
+if '-o' in sys.argv:
+    # batch mode of plantuml: render every input file into the -o directory
+    args = sys.argv[1:]
+    outdir = args[args.index('-o') + 1]
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    for fname in args[args.index('-o') + 2:]:
+        name = os.path.splitext(os.path.basename(fname))[0]
+        with open(os.path.join(outdir, name + '.png'), 'w') as out:
+            out.write('% ' + ' '.join(sys.argv) + '\n')
+            with open(fname) as f:
+                out.write(f.read())
+    sys.exit(0)
+
 print('%', ' '.join(sys.argv))
 for line in sys.stdin:
     sys.stdout.write(line)
@@ -8,7 +8,7 @@ from sphinx.application import Sphinx
 _fixturedir = os.path.join(os.path.dirname(__file__), 'fixture')
 _fakecmd = os.path.join(os.path.dirname(__file__), 'fakecmd.py')
 
-_tempdir = _srcdir = _outdir = None
+_tempdir = _srcdir = _outdir = _app = None
 
 
 def setup():
@@ -29,14 +29,15 @@ def readfile(fname):
 
 
 def runsphinx(text, builder, confoverrides):
+    global _app
     f = open(os.path.join(_srcdir, 'index.rst'), 'w')
     try:
         f.write(text)
     finally:
         f.close()
-    app = Sphinx(_srcdir, _fixturedir, _outdir, _outdir, builder,
-                 confoverrides)
-    app.build()
+    _app = Sphinx(_srcdir, _fixturedir, _outdir, _outdir, builder,
+                  confoverrides)
+    _app.build()
 
 
 def with_runsphinx(builder, confoverrides=None):
@@ -91,6 +92,50 @@ def test_buildhtml_as_link():
     assert '<a href="_images/sadisplay' in readfile('index.html')
 
 
+@with_runsphinx('html')
+def test_buildhtml_shared_module():
+    """Generate HTML with two diagrams of the same module
+
+    .. sadisplay::
+        :module: model
+
+    .. sadisplay::
+        :module: model
+        :link:
+    """
+    files = glob.glob(os.path.join(_outdir, '_images', 'sadisplay-*.png'))
+    assert len(files) == 1
+    assert list(_app.builder._sadisplay_modules) == ['model']
+    assert len(_app.env.sadisplay_images) == 1
+    assert list(_app.env.sadisplay_images.values()) == \
+        [os.path.basename(files[0])]
+
+
+@with_runsphinx('html')
+def test_buildhtml_batch():
+    """Render plantuml diagrams in one batch and graphviz ones in parallel
+
+    .. sadisplay::
+        :module: model
+
+    .. sadisplay::
+        :module: model
+        :exclude: Admin
+
+    .. sadisplay::
+        :module: model
+        :render: graphviz
+    """
+    files = glob.glob(os.path.join(_outdir, '_images', 'sadisplay-*.png'))
+    assert len(files) == 3
+    contents = [readfile(f) for f in files]
+    batched = [c for c in contents if ' -o ' in c.splitlines()[0]]
+    assert len(batched) == 2
+    assert batched[0].splitlines()[0] == batched[1].splitlines()[0]
+    assert '@startuml' in batched[0]
+    assert len(_app.env.sadisplay_images) == 3
+
+
 @with_runsphinx('latex')
 def test_buildlatex_simple():
     """Generate simple LaTeX
@@ -108,3 +153,29 @@ def test_buildlatex_simple():
     assert 'Admin' not in content
     assert 'User' in content
     assert 'Address' in content
+
+
+def test_description_key():
+    from sphinxcontrib.sadisp import description_key, RendererError
+    import sys
+    import sadisplay
+    sys.path.insert(0, os.path.join(_fixturedir, 'app'))
+    try:
+        import model
+    finally:
+        sys.path.pop(0)
+
+    def key():
+        desc = sadisplay.describe([getattr(model, name) for name in dir(model)])
+        return description_key(['model'], desc, 'plantuml', ['plantuml'])
+
+    # nothing that changes between runs, like object addresses, is hashed
+    assert key() == key()
+
+    desc = ([{'name': 'User', 'cols': [(object(), 'id', 'pk')]}], [], [])
+    try:
+        description_key(['model'], desc, 'plantuml', ['plantuml'])
+    except RendererError:
+        pass
+    else:
+        assert False, 'an unserialisable description was hashed'
@@ -12,6 +12,10 @@
 import re
 import posixpath
 import os
+import shutil
+import tempfile
+import threading
+import Queue
 from subprocess import Popen, PIPE
 try:
     from hashlib import sha1 as sha
@@ -63,68 +67,372 @@ class SequenceDiagram(Directive):
         node = sequence_diagram()
         node['code'] = sdeditcode
         node['options'] = self.options
+        env = self.state.document.settings.env
+        if not hasattr(env, 'sdedit_diagrams'):
+            env.sdedit_diagrams = {}
+        env.sdedit_diagrams.setdefault(env.docname, []).append(
+            (sdeditcode, self.options))
         return [node]
 
 
-def render_sdx(self, code, options, format, prefix='sdedit'):
+SERVER_CLASS = 'SdeditServer'
+
+# A thin wrapper which keeps one JVM alive for the whole build. It loads the
+# Main-Class of the sdedit jar once and calls its main() for each request.
+# It first prints "READY", or "UNSUPPORTED" and the reason if it cannot trap
+# the System.exit calls of sdedit. Then one request is a line of tab separated
+# sdedit arguments on stdin; the reply is one line, "OK" or "ERROR" followed
+# by a tab and the escaped output.
+SERVER_SOURCE = r'''
+import java.io.*;
+import java.lang.reflect.*;
+import java.security.Permission;
+import java.util.jar.JarFile;
+
+public class SdeditServer {
+    static class ExitTrapped extends SecurityException {
+        final int status;
+        ExitTrapped(int status) { this.status = status; }
+    }
+
+    public static void main(String[] argv) throws Exception {
+        JarFile jar = new JarFile(argv[0]);
+        String mainClass = jar.getManifest().getMainAttributes()
+            .getValue("Main-Class");
+        Method sdedit = Class.forName(mainClass)
+            .getMethod("main", String[].class);
+        PrintStream out = new PrintStream(
+            new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                public void checkPermission(Permission perm) {}
+                public void checkExit(int status) {
+                    throw new ExitTrapped(status);
+                }
+            });
+        } catch (UnsupportedOperationException e) {
+            // any System.exit of sdedit would end the server
+            out.println("UNSUPPORTED\t" + e.getMessage());
+            return;
+        }
+        out.println("READY");
+
+        BufferedReader in = new BufferedReader(
+            new InputStreamReader(System.in, "UTF-8"));
+        ByteArrayOutputStream log = new ByteArrayOutputStream();
+        PrintStream capture = new PrintStream(log, true, "UTF-8");
+        System.setOut(capture);
+        System.setErr(capture);
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.length() == 0) {
+                continue;
+            }
+            log.reset();
+            String status = "OK";
+            try {
+                sdedit.invoke(null, (Object) line.split("\t"));
+            } catch (InvocationTargetException e) {
+                Throwable cause = e.getCause();
+                if (!(cause instanceof ExitTrapped)
+                        || ((ExitTrapped) cause).status != 0) {
+                    status = "ERROR";
+                    cause.printStackTrace(capture);
+                }
+            } catch (Exception e) {
+                status = "ERROR";
+                e.printStackTrace(capture);
+            }
+            String message = log.toString("UTF-8")
+                .replace("\\", "\\\\").replace("\n", "\\n");
+            out.println(status + "\t" + message);
+        }
+    }
+}
+'''
+
+
+class SdeditServer(object):
     """
-    Render sequence diagram into a PNG or PDF output file.
+    A single sdedit JVM which renders diagrams sent through a pipe.
     """
-    hashkey = code.encode('utf-8') + str(options) + \
-              str(self.builder.config.sdedit_args)
-    ofname = '%s-%s.%s' % (prefix, sha(hashkey).hexdigest(), format)
-    ifname = '%s-%s.sd' % (prefix, sha(hashkey).hexdigest())
-    infn = os.path.join(self.builder.outdir, ifname)
-    if hasattr(self.builder, 'imgpath'):
-        # HTML
-        relfn = posixpath.join(self.builder.imgpath, ofname)
-        outfn = os.path.join(self.builder.outdir, '_images', ofname)
-    else:
-        # LaTeX
-        relfn = ofname
-        outfn = os.path.join(self.builder.outdir, ofname)
-    if os.path.isfile(outfn):
-        return relfn, outfn
 
-    if hasattr(self.builder, '_sdedit_warned'):
-        return None, None
+    def __init__(self, java, jar, tempdir):
+        source = os.path.join(tempdir, SERVER_CLASS + '.java')
+        f = open(source, 'w')
+        f.write(SERVER_SOURCE)
+        f.close()
+        self.log = open(os.path.join(tempdir, 'server.log'), 'w')
+        # Java 18 to 23 only allow security managers if asked to; Java 11
+        # does not know "allow" and later versions refuse it, so try again
+        # without it. Single-file source launch needs Java 11 or newer.
+        for options in (['-Djava.security.manager=allow'], []):
+            self.process = Popen([java] + options +
+                                 ['-cp', jar, source, os.path.abspath(jar)],
+                                 stdin=PIPE, stdout=PIPE, stderr=self.log)
+            status, _, reason = self.process.stdout.readline() \
+                .rstrip('\n').partition('\t')
+            if status == 'READY':
+                break
+            self.process.stdin.close()
+            self.process.wait()
+        else:
+            self.log.close()
+            raise IOError(reason or 'the JVM exited, see %s' % self.log.name)
+
+    def render(self, args):
+        """
+        Run sdedit with *args*. Raise SdeditError if sdedit failed and
+        IOError if the server has gone away. A server renders one diagram at
+        a time; acquire_server hands it to one thread only.
+        """
+        request = '\t'.join(args)
+        if isinstance(request, unicode):
+            request = request.encode('utf-8')
+        try:
+            self.process.stdin.write(request + '\n')
+            self.process.stdin.flush()
+        except ValueError:
+            raise IOError('sdedit server is closed')
+        reply = self.process.stdout.readline()
+        if not reply:
+            raise IOError('sdedit server exited unexpectedly')
+        status, _, message = reply.rstrip('\n').partition('\t')
+        message = re.sub(r'\\(.)', lambda m: m.group(1) == 'n' and '\n'
+                         or m.group(1), message)
+        if status != 'OK':
+            raise SdeditError('sdedit exited with error:\n%s' % message)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+        self.log.close()
+
+
+def get_tempdir(builder):
+    # use only one tempdir per build, it is removed at once in
+    # cleanup_sdedit
+    if not hasattr(builder, '_sdedit_tempdir'):
+        builder._sdedit_tempdir = tempfile.mkdtemp()
+    return builder._sdedit_tempdir
+
+
+def init_servers(builder):
+    """
+    Set up the pool of SdeditServers of *builder*, before any thread uses it.
+    """
+    if not hasattr(builder, '_sdedit_servers'):
+        builder._sdedit_servers = []          # all started servers
+        builder._sdedit_idle = Queue.Queue()  # servers free to use
+        builder._sdedit_lock = threading.Lock()
+
 
+def acquire_server(builder):
+    """
+    Return an idle SdeditServer of *builder* for the calling thread only,
+    starting one if fewer than sdedit_jobs are running, or None if servers
+    were not requested or cannot be used. Give it back with release_server.
+    """
+    config = builder.config
+    if not config.sdedit_server or not config.sdedit_path.endswith('.jar'):
+        return None
+    init_servers(builder)
+    builder._sdedit_lock.acquire()
+    try:
+        if hasattr(builder, '_sdedit_server_failed'):
+            return None
+        try:
+            return builder._sdedit_idle.get_nowait()
+        except Queue.Empty:
+            start = len(builder._sdedit_servers) < max(1, config.sdedit_jobs)
+            if start:
+                builder._sdedit_servers.append(None)  # reserve a slot
+    finally:
+        builder._sdedit_lock.release()
+
+    if not start:
+        server = builder._sdedit_idle.get()
+        if server is None:
+            # the servers were turned off, wake up the next waiting thread
+            builder._sdedit_idle.put(None)
+        return server
+
+    try:
+        server = SdeditServer(config.sdedit_java_path, config.sdedit_path,
+                              get_tempdir(builder))
+    except (OSError, IOError), err:
+        # give up the slot and wake up the threads waiting for a server
+        builder._sdedit_lock.acquire()
+        try:
+            builder._sdedit_servers.remove(None)
+        finally:
+            builder._sdedit_lock.release()
+        if isinstance(err, IOError):
+            disable_servers(builder, 'sdedit server cannot be used (%s), '
+                            'rendering with one sdedit process per diagram'
+                            % err)
+            return None
+        disable_servers(builder, 'sdedit server cannot be started, check '
+                        'the sdedit_java_path setting')
+        if err.errno != 2:   # No such file or directory
+            raise
+        return None
+    builder._sdedit_lock.acquire()
+    try:
+        builder._sdedit_servers[builder._sdedit_servers.index(None)] = server
+    finally:
+        builder._sdedit_lock.release()
+    return server
+
+
+def release_server(builder, server):
+    builder._sdedit_idle.put(server)
+
+
+def disable_servers(builder, message):
+    """
+    Render with one sdedit process per diagram from now on.
+    """
+    builder._sdedit_lock.acquire()
+    try:
+        if not hasattr(builder, '_sdedit_server_failed'):
+            builder.warn(message)
+            builder._sdedit_server_failed = True
+            builder._sdedit_idle.put(None)
+    finally:
+        builder._sdedit_lock.release()
+
+
+def get_hashkey(config, code, options):
+    return sha(code.encode('utf-8') + str(options) +
+               str(config.sdedit_args)).hexdigest()
+
+
+def get_cache_dir(builder):
+    cache_dir = builder.config.sdedit_cache_dir
+    if cache_dir is None:
+        return os.path.join(builder.doctreedir, 'sdedit')
+    return os.path.join(builder.confdir, cache_dir)
+
+
+def copy_from_cache(cachefn, outfn):
     ensuredir(os.path.dirname(outfn))
-    ensuredir(os.path.dirname(infn))
+    try:
+        os.link(cachefn, outfn)
+    except (AttributeError, OSError):
+        shutil.copyfile(cachefn, outfn)
+
+
+def render_cached(builder, code, options, format, prefix='sdedit'):
+    """
+    Render sequence diagram into the cache directory and return the path of
+    the cached file, or None if sdedit cannot be run.
+    """
+    hashkey = get_hashkey(builder.config, code, options)
+    ofname = '%s-%s.%s' % (prefix, hashkey, format)
+    cachefn = os.path.join(get_cache_dir(builder), ofname)
+    if os.path.isfile(cachefn):
+        return cachefn
+    errors = getattr(builder, '_sdedit_errors', {})
+    if cachefn in errors:
+        raise errors[cachefn]
+
+    if hasattr(builder, '_sdedit_warned'):
+        return None
+
+    # render into the tempdir first, so that a build sharing the cache
+    # directory never sees a partially written file
+    tempdir = get_tempdir(builder)
+    infn = os.path.join(tempdir, '%s-%s.sd' % (prefix, hashkey))
+    outfn = os.path.join(tempdir, ofname)
     inputfile = open(infn, "w")
     if isinstance(code, unicode):
         code = code.encode('utf-8')
     inputfile.write(code)
     inputfile.close()
 
-    path = self.builder.config.sdedit_path
-    if path.endswith(".jar"):
-        sdedit_args = [self.builder.config.sdedit_java_path, "-jar", path]
-    else:
-        sdedit_args = [path]
-    sdedit_args.extend(self.builder.config.sdedit_args)
+    sdedit_args = list(builder.config.sdedit_args)
     sdedit_args.extend(['-t', format, '-o', outfn, infn])
     if options.get("linewrap"):
         sdedit_args.extend(['--lineWrap', 'true'])
     if options.get("threadnumber"):
         sdedit_args.extend(['--threadNumbersVisible', 'true'])
+
+    if not run_sdedit(builder, sdedit_args):
+        return None
+    os.remove(infn)
+    ensuredir(os.path.dirname(cachefn))
+    shutil.move(outfn, cachefn)
+    return cachefn
+
+
+def run_sdedit(builder, sdedit_args):
+    """
+    Run sdedit with *sdedit_args*, through a server if they are used.
+    Return False if sdedit cannot be run.
+    """
+    server = acquire_server(builder)
+    if server is not None:
+        try:
+            server.render(sdedit_args)
+        except IOError:
+            server.close()
+            disable_servers(builder, 'sdedit server stopped, falling back '
+                            'to one sdedit process per diagram')
+        except SdeditError:
+            release_server(builder, server)
+            raise
+        else:
+            release_server(builder, server)
+            return True
+
+    path = builder.config.sdedit_path
+    if path.endswith(".jar"):
+        sdedit_args = [builder.config.sdedit_java_path, "-jar", path] + \
+                      sdedit_args
+    else:
+        sdedit_args = [path] + sdedit_args
     try:
         p = Popen(sdedit_args, stdout=PIPE, stdin=None, stderr=PIPE)
     except OSError, err:
         if err.errno != 2:   # No such file or directory
             raise
-        self.builder.warn('sdedit command %r cannot be run (needed for '
-                          'sequence diagram output), check the sdedit_path '
-                          ' setting' %
-                          self.builder.config.sdedit_path)
-        self.builder._sdedit_warned = True
-        return None, None
+        builder.warn('sdedit command %r cannot be run (needed for '
+                     'sequence diagram output), check the sdedit_path '
+                     ' setting' % builder.config.sdedit_path)
+        builder._sdedit_warned = True
+        return False
 
     stdout, stderr = p.communicate()
     if p.returncode != 0:
         raise SdeditError('sdedit exited with error:\n[stderr]\n%s\n'
                             '[stdout]\n%s' % (stderr, stdout))
-    os.remove(infn)
+    return True
+
+
+def render_sdx(self, code, options, format, prefix='sdedit'):
+    """
+    Render sequence diagram into a PNG or PDF output file.
+    """
+    hashkey = get_hashkey(self.builder.config, code, options)
+    ofname = '%s-%s.%s' % (prefix, hashkey, format)
+    if hasattr(self.builder, 'imgpath'):
+        # HTML
+        relfn = posixpath.join(self.builder.imgpath, ofname)
+        outfn = os.path.join(self.builder.outdir, '_images', ofname)
+    else:
+        # LaTeX
+        relfn = ofname
+        outfn = os.path.join(self.builder.outdir, ofname)
+    if os.path.isfile(outfn):
+        return relfn, outfn
+
+    cachefn = render_cached(self.builder, code, options, format, prefix)
+    if cachefn is None:
+        return None, None
+    copy_from_cache(cachefn, outfn)
     return relfn, outfn
 
 
@@ -196,6 +504,80 @@ def render_sdx_latex(self, node, code, options, prefix='sdedit'):
 def latex_visit_sequence_diagram(self, node):
     render_sdx_latex(self, node, node['code'], node['options'])
 
+def purge_sdedit_diagrams(app, env, docname):
+    if hasattr(env, 'sdedit_diagrams'):
+        env.sdedit_diagrams.pop(docname, None)
+
+
+def prerender_sdedit(app, env):
+    """
+    Render all diagrams which are not cached yet, using sdedit_jobs threads,
+    before the builder starts writing.
+    """
+    format = {'html': 'png', 'latex': 'pdf'}.get(app.builder.format)
+    if format is None:
+        return
+    builder = app.builder
+    pending = {}
+    for diagrams in getattr(env, 'sdedit_diagrams', {}).values():
+        for code, options in diagrams:
+            hashkey = get_hashkey(builder.config, code, options)
+            pending[hashkey] = (code, options)
+    queue = Queue.Queue()
+    cache_dir = get_cache_dir(builder)
+    for hashkey, diagram in pending.items():
+        if not os.path.isfile(os.path.join(
+                cache_dir, 'sdedit-%s.%s' % (hashkey, format))):
+            queue.put(diagram)
+    if queue.empty():
+        return
+
+    # set up the shared state here, not racing in the workers
+    get_tempdir(builder)
+    init_servers(builder)
+    builder._sdedit_errors = {}
+
+    def worker():
+        while True:
+            try:
+                code, options = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                render_cached(builder, code, options, format)
+            except SdeditError, exc:
+                # reported by the visitor when the diagram is written
+                hashkey = get_hashkey(builder.config, code, options)
+                cachefn = os.path.join(
+                    cache_dir, 'sdedit-%s.%s' % (hashkey, format))
+                builder._sdedit_errors[cachefn] = exc
+
+    threads = [threading.Thread(target=worker)
+               for i in range(max(1, min(builder.config.sdedit_jobs,
+                                         queue.qsize())))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def start_sdedit_server(app):
+    server = acquire_server(app.builder)
+    if server is not None:
+        release_server(app.builder, server)
+
+
+def cleanup_sdedit(app, exc):
+    if hasattr(app.builder, '_sdedit_servers'):
+        for server in app.builder._sdedit_servers:
+            if server is not None:
+                server.close()
+        del app.builder._sdedit_servers
+    if hasattr(app.builder, '_sdedit_tempdir'):
+        shutil.rmtree(app.builder._sdedit_tempdir, ignore_errors=True)
+        del app.builder._sdedit_tempdir
+
+
 def setup(app):
     app.add_node(sequence_diagram,
                  html=(html_visit_sequence_diagram, None),
@@ -206,3 +588,10 @@ def setup(app):
     app.add_config_value('sdedit_args', [], 'html')
     app.add_config_value('sdedit_default_options', 
                          {'maxwidth':700}, 'html')
+    app.add_config_value('sdedit_server', False, 'html')
+    app.add_config_value('sdedit_jobs', 1, 'html')
+    app.add_config_value('sdedit_cache_dir', None, 'html')
+    app.connect('builder-inited', start_sdedit_server)
+    app.connect('env-purge-doc', purge_sdedit_diagrams)
+    app.connect('env-updated', prerender_sdedit)
+    app.connect('build-finished', cleanup_sdedit)
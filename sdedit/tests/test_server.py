@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from sphinxcontrib import sdedit
+
+
+class Config(object):
+    sdedit_server = True
+    sdedit_path = 'sdedit.jar'
+    sdedit_jobs = 2
+
+
+class Builder(object):
+    def __init__(self, java):
+        self.config = Config()
+        self.config.sdedit_java_path = java
+        self.warnings = []
+
+    def warn(self, message):
+        self.warnings.append(message)
+
+
+class TestServerStartFailure(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        sdedit.cleanup_sdedit(type('App', (), {'builder': self.builder}), None)
+        shutil.rmtree(self.tempdir)
+
+    def acquire_in_threads(self, builder, count):
+        results = []
+
+        def acquire():
+            try:
+                results.append(sdedit.acquire_server(builder))
+            except OSError, err:
+                results.append(err)
+
+        threads = [threading.Thread(target=acquire) for i in range(count)]
+        for thread in threads:
+            thread.daemon = True  # a blocked thread must not hang the tests
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertFalse([t for t in threads if t.is_alive()],
+                         'threads waiting for a server were not woken up')
+        return results
+
+    def test_not_executable(self):
+        java = os.path.join(self.tempdir, 'java')
+        open(java, 'w').close()
+        os.chmod(java, 0644)
+        builder = self.builder = Builder(java)
+        results = self.acquire_in_threads(builder, 5)
+        self.assertEqual(len(results), 5)
+        errors = [r for r in results if isinstance(r, OSError)]
+        self.assertTrue(errors)
+        self.assertEqual([r for r in results if r not in errors],
+                         [None] * (5 - len(errors)))
+        self.assertEqual(len(builder.warnings), 1)
+        self.assertFalse(builder._sdedit_servers)
+
+    def test_missing(self):
+        builder = self.builder = Builder(os.path.join(self.tempdir, 'missing'))
+        self.assertEqual(self.acquire_in_threads(builder, 5), [None] * 5)
+        self.assertEqual(len(builder.warnings), 1)
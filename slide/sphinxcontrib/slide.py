@@ -7,8 +7,13 @@
     :license: BSD, see LICENSE for details.
 """
 
+import os
 import re
+import json
+import time
+import Queue
 import urllib2
+import threading
 from docutils import nodes
 from sphinx.util.compat import Directive
 
@@ -31,7 +36,13 @@ class SlideDirective(Directive):
         try:
             node = slide()
             node['url'] = self.arguments[0]
-            node['slide_options'] = get_slide_options(self.arguments[0])
+            get_slide_options_handler(node['url'])
+
+            # slide options are fetched together after reading all documents
+            env = self.state.document.settings.env
+            if not hasattr(env, 'slide_urls'):
+                env.slide_urls = {}
+            env.slide_urls.setdefault(env.docname, set()).add(node['url'])
 
             return [node]
         except Exception, e:
@@ -39,20 +50,24 @@ class SlideDirective(Directive):
             return [reporter.warning(str(e), line=self.lineno)]
 
 
-def get_slide_options(url):
+def get_slide_options_handler(url):
     if re.match('https://docs.google.com/presentation/(pub\?|d/)', url):
-        return get_slide_options_for_googledocs(url)
+        return get_slide_options_for_googledocs
     elif re.match('http://www.slideshare.net/', url):
-        return get_slide_options_for_slideshare(url)
+        return get_slide_options_for_slideshare
     elif re.match('https://speakerdeck.com/', url):
-        return get_slide_options_for_speakerdeck(url)
+        return get_slide_options_for_speakerdeck
     elif re.match('https?://slides.com/', url):
-        return get_slide_options_for_slides_com(url)
+        return get_slide_options_for_slides_com
     else:
         msg = 'unknown slide URL: %s' % url
         raise Exception(msg)
 
 
+def get_slide_options(url):
+    return get_slide_options_handler(url)(url)
+
+
 def get_slide_options_for_googledocs(url):
     options = {}
     options['type'] = 'googledocs'
@@ -126,8 +141,158 @@ def get_slide_options_for_slides_com(url):
     return options
 
 
+def get_cache_path(app):
+    return os.path.join(app.doctreedir, 'slide.json')
+
+
+def get_written_docs(app):
+    """
+    Get the documents the builder is going to write, or None for all.
+    """
+    outdated = app.builder.get_outdated_docs()
+    if isinstance(outdated, basestring):
+        return None  # the builder writes all documents
+
+    return set(outdated) | getattr(app.builder, '_slide_read', set())
+
+
+def fetch_slide_options(app, env):
+    """
+    Get options of the slides used in the documents to write before the
+    builder starts writing. Options are cached across builds for
+    ``slide_cache_ttl`` seconds, and outdated ones are fetched concurrently.
+    """
+    try:
+        with open(get_cache_path(app)) as fd:
+            cache = json.load(fd)
+    except (IOError, ValueError):
+        cache = {}
+
+    written = get_written_docs(app)
+    docnames = {}
+    wanted = set()
+    for docname, urls in getattr(env, 'slide_urls', {}).items():
+        for url in urls:
+            docnames.setdefault(url, docname)
+        if written is None or docname in written:
+            wanted.update(urls)
+
+    now = time.time()
+    queue = Queue.Queue()
+    for url in sorted(wanted):
+        if url in cache:
+            if app.config.slide_offline:
+                continue
+            elif now - cache[url]['fetched'] < app.config.slide_cache_ttl:
+                continue
+        elif app.config.slide_offline:
+            app.warn('slide %s is not cached (slide_offline is enabled)' % url,
+                     docnames[url])
+            continue
+
+        queue.put(url)
+
+    errors = {}
+
+    def worker():
+        while True:
+            try:
+                url = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                options = get_slide_options(url)
+                cache[url] = dict(options=options, fetched=time.time())
+            except Exception, e:
+                errors[url] = e
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(app.config.slide_max_connections,
+                                  queue.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for url, error in sorted(errors.items()):
+        if url in cache:
+            app.warn('fail to fetch slide %s, use cached one: %s' %
+                     (url, error), docnames[url])
+        else:
+            app.warn('fail to fetch slide %s: %s' % (url, error),
+                     docnames[url])
+
+    app.builder._slide_cache = cache
+    app.builder._slide_cache_updated = bool(threads)
+
+    # slides which could not be fetched are left out
+    app.builder._slide_options = dict((url, None) for url in wanted)
+    app.builder._slide_options.update((url, cache[url]['options'])
+                                      for url in docnames if url in cache)
+
+
+def fetch_slide(builder, url):
+    """
+    Get options of a slide whose document was not expected to be written.
+    """
+    try:
+        options = get_slide_options(url)
+    except Exception, e:
+        builder.warn('fail to fetch slide %s: %s' % (url, e))
+        return None
+
+    if hasattr(builder, '_slide_cache'):
+        builder._slide_cache[url] = dict(options=options, fetched=time.time())
+        builder._slide_cache_updated = True
+    return options
+
+
+def save_slide_cache(app, exception):
+    if getattr(app.builder, '_slide_cache_updated', False):
+        try:
+            with open(get_cache_path(app), 'w') as fd:
+                json.dump(app.builder._slide_cache, fd)
+        except IOError:
+            app.warn('fail to save slide cache: %s' % get_cache_path(app))
+
+    for name in ('_slide_read', '_slide_cache', '_slide_cache_updated',
+                 '_slide_options'):
+        if hasattr(app.builder, name):
+            delattr(app.builder, name)
+
+
+def purge_slide_urls(app, env, docname):
+    if hasattr(env, 'slide_urls'):
+        env.slide_urls.pop(docname, None)
+
+    # documents read in this build are written too
+    if not hasattr(app.builder, '_slide_read'):
+        app.builder._slide_read = set()
+    app.builder._slide_read.add(docname)
+
+
+def get_options_for(builder, node):
+    if 'slide_options' in node:  # read by older version
+        return node['slide_options']
+
+    if not hasattr(builder, '_slide_options'):
+        builder._slide_options = {}
+    options = builder._slide_options
+    if node['url'] not in options:
+        if builder.config.slide_offline:
+            builder.warn('slide %s is not cached (slide_offline is enabled)'
+                         % node['url'])
+            options[node['url']] = None
+        else:
+            options[node['url']] = fetch_slide(builder, node['url'])
+    return options[node['url']]
+
+
 def html_visit_slide_node(self, node):
-    options = node['slide_options']
+    options = get_options_for(self.builder, node)
+    if options is None:
+        raise nodes.SkipNode
 
     if options['type'] == 'googledocs':
         template = """<iframe src="%s" frameborder="0" width="480" height="375" allowfullscreen="true" mozallowfullscreen="true" webkitallowfullscreen="true"> </iframe>"""
@@ -151,7 +316,7 @@ def html_visit_slide_node(self, node):
 
 
 def latex_visit_slide_node(self, node):
-    title = node['slide_options'].get('title')
+    title = (get_options_for(self.builder, node) or {}).get('title')
 
     if title:
         self.body.append("\\href{%s}{%s}" % (self.encode_uri(node['url']), self.encode(title)))
@@ -168,3 +333,9 @@ def setup(app):
                  html=(html_visit_slide_node, depart_slide_node),
                  latex=(latex_visit_slide_node, depart_slide_node))
     app.add_directive('slide', SlideDirective)
+    app.add_config_value('slide_cache_ttl', 86400, 'html')
+    app.add_config_value('slide_max_connections', 4, 'html')
+    app.add_config_value('slide_offline', False, 'html')
+    app.connect('env-purge-doc', purge_slide_urls)
+    app.connect('env-updated', fetch_slide_options)
+    app.connect('build-finished', save_slide_cache)
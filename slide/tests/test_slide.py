@@ -0,0 +1,188 @@
+import os
+import json
+import shutil
+import urllib2
+import tempfile
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+from docutils import nodes
+
+from sphinxcontrib import slide
+
+URL = 'http://slides.com/%s'
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A stand-in of slides.com, used as the HTTP proxy of urllib2.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.requests = []
+
+    def count(self, name):
+        return self.requests.count(URL % name)
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.endswith('broken'):
+            self.send_error(500)
+            return
+
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write('<h4>%s</h4>' % self.path.split('/')[-1])
+
+    def log_message(self, *args):
+        pass
+
+
+class Config(object):
+    slide_cache_ttl = 86400
+    slide_max_connections = 4
+    slide_offline = False
+
+
+class Builder(object):
+    def __init__(self, outdated):
+        self.config = Config()
+        self.outdated = outdated
+        self.warnings = []
+
+    def get_outdated_docs(self):
+        return self.outdated
+
+    def warn(self, message, location=None):
+        self.warnings.append(message)
+
+
+class App(object):
+    def __init__(self, doctreedir, outdated, offline):
+        self.builder = Builder(outdated)
+        self.config = self.builder.config
+        self.config.slide_offline = offline
+        self.doctreedir = doctreedir
+        self.warn = self.builder.warn
+
+
+class Env(object):
+    def __init__(self, slide_urls):
+        self.slide_urls = slide_urls
+
+
+class Translator(object):
+    def __init__(self, builder):
+        self.builder = builder
+        self.body = []
+
+
+class TestFetchSlideOptions(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        proxy = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        urllib2.install_opener(urllib2.build_opener(
+            urllib2.ProxyHandler({'http': proxy})))
+        self.doctreedir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.doctreedir, 'slide.json')
+
+    def tearDown(self):
+        urllib2.install_opener(None)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.doctreedir)
+
+    def build(self, slide_urls, outdated='all documents', offline=False):
+        """Fetch the options of *slide_urls* (a dict of docname to names of
+        slides) and return the app, as the build would"""
+        app = App(self.doctreedir, outdated, offline)
+        env = Env(dict((docname, set(URL % name for name in names))
+                       for docname, names in slide_urls.items()))
+        slide.fetch_slide_options(app, env)
+        return app
+
+    def visit(self, app, name):
+        translator = Translator(app.builder)
+        node = slide.slide(url=URL % name)
+        try:
+            slide.html_visit_slide_node(translator, node)
+        except nodes.SkipNode:
+            return None
+        return ''.join(translator.body)
+
+    def finish(self, app):
+        slide.save_slide_cache(app, None)
+
+    def test_fetched(self):
+        app = self.build({'index': ['one', 'two'], 'other': ['one']})
+        self.assertEqual(self.server.count('one'), 1)
+        self.assertEqual(self.server.count('two'), 1)
+        self.assertTrue('//slides.com/one/embed' in self.visit(app, 'one'))
+        self.finish(app)
+
+    def test_cached(self):
+        self.finish(self.build({'index': ['one']}))
+        app = self.build({'index': ['one']})
+        self.assertEqual(self.server.count('one'), 1)
+        self.assertTrue('//slides.com/one/embed' in self.visit(app, 'one'))
+        self.finish(app)
+
+    def test_expired(self):
+        self.finish(self.build({'index': ['one']}))
+        with open(self.cache_path) as fd:
+            cache = json.load(fd)
+        cache[URL % 'one']['fetched'] -= 86401
+        with open(self.cache_path, 'w') as fd:
+            json.dump(cache, fd)
+
+        self.finish(self.build({'index': ['one']}))
+        self.assertEqual(self.server.count('one'), 2)
+
+    def test_offline(self):
+        self.finish(self.build({'index': ['one']}))
+        app = self.build({'index': ['one', 'two']}, offline=True)
+        self.assertEqual(self.server.requests, [URL % 'one'])
+        self.assertTrue('//slides.com/one/embed' in self.visit(app, 'one'))
+        self.assertEqual(self.visit(app, 'two'), None)
+        self.assertEqual(len(app.builder.warnings), 1)
+        self.finish(app)
+
+    def test_failed(self):
+        app = self.build({'index': ['broken']})
+        self.assertEqual(self.visit(app, 'broken'), None)
+        self.assertEqual(self.server.count('broken'), 1)
+        self.assertEqual(len(app.builder.warnings), 1)
+        self.finish(app)
+
+    def test_written_docs_only(self):
+        app = self.build({'index': ['one'], 'other': ['two']},
+                         outdated=iter(['index']))
+        self.assertEqual(self.server.count('one'), 1)
+        self.assertEqual(self.server.count('two'), 0)
+
+        # a document written unexpectedly still gets its slide
+        self.assertTrue('//slides.com/two/embed' in self.visit(app, 'two'))
+        self.assertEqual(self.server.count('two'), 1)
+        self.finish(app)
+
+        app = self.build({'index': ['one'], 'other': ['two']})
+        self.assertEqual(self.server.requests,
+                         [URL % 'one', URL % 'two'])
+
+    def test_read_docs(self):
+        app = App(self.doctreedir, [], False)
+        env = Env({'index': set([URL % 'one'])})
+        slide.purge_slide_urls(app, env, 'other')
+        env.slide_urls['other'] = set([URL % 'two'])
+        slide.fetch_slide_options(app, env)
+        self.assertEqual(self.server.requests, [URL % 'two'])
+        self.finish(app)